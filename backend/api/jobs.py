@@ -0,0 +1,105 @@
+import contextvars
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
+
+from lib.OpenStreetMapGetter import Costia_getData_with_coordinates, Costia_getData_batch
+from .models import SearchJob
+import logs
+
+logger = logs.get_logger(__name__)
+
+# Searches run here, outside of the request workers. They must not run on the
+# fetcher pool since DataProvider waits on it.
+_executor = ThreadPoolExecutor(max_workers=settings.SEARCH_JOB_WORKERS, thread_name_prefix="search-job")
+
+def submit(lat, lon):
+	"""Creates a pending job for the site and queues it, returns the job"""
+	job = SearchJob.objects.create(lat=lat, lon=lon)
+	# The job keeps the correlation id of the request that submitted it
+	_executor.submit(contextvars.copy_context().run, run, job.id)
+	return job
+
+def submit_batch(sites):
+	"""Creates a pending job for the (lat, lon) sites and queues it, returns the job"""
+	job = SearchJob.objects.create(sites=[[lat, lon] for lat, lon in sites])
+	_executor.submit(contextvars.copy_context().run, run, job.id)
+	return job
+
+def _save_stage(job, stage, data):
+	job.stage = stage
+	job.stages[stage] = data
+	job.save(update_fields=['stage', 'stages', 'updated_at'])
+
+def _search(job):
+	on_stage = lambda stage, data: _save_stage(job, stage, data)
+	if job.sites is not None:
+		# Each commune scored is saved as a stage, which also keeps a long batch from expiring
+		return {'results': Costia_getData_batch([tuple(site) for site in job.sites], on_stage=on_stage)}
+	return Costia_getData_with_coordinates(job.lat, job.lon, on_stage=on_stage)
+
+def run(job_id):
+	close_old_connections()
+	try:
+		job = SearchJob.objects.get(id=job_id)
+		job.status = SearchJob.RUNNING
+		job.save(update_fields=['status', 'updated_at'])
+		try:
+			res = _search(job)
+			if isinstance(res, dict):
+				job.status = SearchJob.DONE
+				job.result = res
+			else:
+				job.status = SearchJob.FAILED
+				job.error = str(res)
+		except Exception as e:
+			logger.exception("Search job %s failed", job_id)
+			job.status = SearchJob.FAILED
+			job.error = str(e)
+		job.save(update_fields=['status', 'result', 'error', 'updated_at'])
+	except Exception as e:
+		logger.exception("An error occurred while running search job %s", job_id)
+	finally:
+		# Connections of pool threads are not closed by the request cycle
+		connection.close()
+
+def expire_if_stale(job):
+	"""
+	Fails a pending or running job that made no progress for
+	SEARCH_JOB_TIMEOUT seconds: jobs only live in the pool of the worker
+	process that accepted them, and are lost when it is recycled or killed
+	"""
+	if job.status not in (SearchJob.PENDING, SearchJob.RUNNING):
+		return job
+	now = timezone.now()
+	if job.updated_at >= now - timedelta(seconds=settings.SEARCH_JOB_TIMEOUT):
+		return job
+	# Only if the job did not move meanwhile, a live worker may just have saved it
+	SearchJob.objects.filter(id=job.id, status=job.status, updated_at=job.updated_at).update(
+		status=SearchJob.FAILED,
+		error=f"Search job expired after {settings.SEARCH_JOB_TIMEOUT}s without progress",
+		updated_at=now,
+	)
+	job.refresh_from_db()
+	return job
+
+def as_dict(job):
+	return {
+		'job_id': str(job.id),
+		'status': job.status,
+		'lat': job.lat,
+		'lon': job.lon,
+		'sites': job.sites,
+		'stage': job.stage,
+		'stages': job.stages,
+		'result': job.result,
+		'error': job.error,
+		'created_at': job.created_at,
+		'updated_at': job.updated_at,
+	}
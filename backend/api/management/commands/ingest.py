@@ -0,0 +1,41 @@
+import os
+import sqlite3
+import time
+from django.core.management.base import BaseCommand, CommandError
+
+import communedb
+import ingest
+
+class Command(BaseCommand):
+	help = "Loads the reference CSVs in a new snapshot of the communes database and makes it current"
+
+	def add_arguments(self, parser):
+		parser.add_argument("--db", default=communedb.COMMUNES_DB_PATH, help="SQLite database read by the lookups (COMMUNES_DB_PATH)")
+		parser.add_argument("--communes", default="./data/raw/communes-france-2025.csv")
+		parser.add_argument("--unemployed", default="./data/raw/Unemployed.csv")
+		parser.add_argument("--job-offers", default="./data/raw/JobOffer.csv")
+		parser.add_argument("--if-missing", action="store_true", help="only load when the database has no current snapshot yet")
+		parser.add_argument("--schools", default="./data/raw/School.csv", help="optional, the snapshot has no schools when the file is missing")
+
+	def handle(self, *args, **options):
+		if options["if_missing"]:
+			try:
+				version = communedb.current_version(options["db"])
+			except sqlite3.Error:
+				version = None
+			if version is not None:
+				self.stdout.write(f"Snapshot {version} of {options['db']} is current, nothing to load")
+				return
+		schools = options["schools"]
+		if not os.path.exists(schools):
+			self.stderr.write(self.style.WARNING(f"{schools} not found, the snapshot has no schools and the school charge of the searches is empty"))
+			schools = None
+		start = time.perf_counter()
+		try:
+			version, counts = ingest.load(options["db"], options["communes"], options["unemployed"], options["job_offers"], schools)
+		except (OSError, KeyError) as e:
+			raise CommandError(f"Ingestion failed, the current snapshot is unchanged: {e!r}")
+		self.stdout.write(self.style.SUCCESS(
+			f"Snapshot {version} of {options['db']} is current in {time.perf_counter() - start:.2f}s: "
+			+ ", ".join(f"{count} {table}" for table, count in counts.items())
+		))
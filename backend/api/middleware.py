@@ -0,0 +1,22 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
+
+import logs
+
+class CorrelationIdMiddleware:
+	"""
+	Gives every request a correlation id, taken from the X-Request-ID header
+	when the client or proxy sent one, attached to its log records and
+	returned in the response headers
+	"""
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+
+	def __call__(self, request):
+		request.correlation_id = logs.new_correlation_id(request.headers.get('X-Request-ID', '')[:64] or None)
+		response = self.get_response(request)
+		response['X-Request-ID'] = request.correlation_id
+		return response
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-17 02:22
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+	dependencies = [
+		('api', '0001_initial'),
+	]
+
+	operations = [
+		migrations.CreateModel(
+			name='SearchJob',
+			fields=[
+				('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+				('lat', models.FloatField()),
+				('lon', models.FloatField()),
+				('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+				('stage', models.CharField(blank=True, max_length=20)),
+				('stages', models.JSONField(blank=True, default=dict)),
+				('result', models.JSONField(blank=True, null=True)),
+				('error', models.TextField(blank=True)),
+				('created_at', models.DateTimeField(auto_now_add=True)),
+				('updated_at', models.DateTimeField(auto_now=True)),
+			],
+			options={
+				'indexes': [models.Index(fields=['status'], name='api_searchj_status_ee31a5_idx'), models.Index(fields=['created_at'], name='api_searchj_created_4040d9_idx')],
+			},
+		),
+	]
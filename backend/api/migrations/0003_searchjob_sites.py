@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-17 03:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+	dependencies = [
+		('api', '0002_searchjob'),
+	]
+
+	operations = [
+		migrations.AddField(
+			model_name='searchjob',
+			name='sites',
+			field=models.JSONField(blank=True, null=True),
+		),
+		migrations.AlterField(
+			model_name='searchjob',
+			name='lat',
+			field=models.FloatField(blank=True, null=True),
+		),
+		migrations.AlterField(
+			model_name='searchjob',
+			name='lon',
+			field=models.FloatField(blank=True, null=True),
+		),
+	]
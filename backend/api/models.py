@@ -1,3 +1,4 @@
+import uuid
 from django.db import models
 
 # Create your models here.
@@ -61,3 +62,44 @@ class JobOfferData(models.Model):
 
 	def __str__(self):
 		return f"{self.departement}: {self.job_offer} job offers"
+
+
+class SearchJob(models.Model):
+	"""
+	Asynchronous search submitted to /api/search/, or batch of sites submitted
+	to /api/search/batch/, and executed by the job worker pool
+	"""
+	PENDING = 'pending'
+	RUNNING = 'running'
+	DONE = 'done'
+	FAILED = 'failed'
+	STATUS_CHOICES = [
+		(PENDING, 'Pending'),
+		(RUNNING, 'Running'),
+		(DONE, 'Done'),
+		(FAILED, 'Failed'),
+	]
+
+	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+	lat = models.FloatField(null=True, blank=True)
+	lon = models.FloatField(null=True, blank=True)
+	# [[lat, lon], ...] of a batch job, whose lat and lon are then empty
+	sites = models.JSONField(null=True, blank=True)
+	status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+	stage = models.CharField(max_length=20, blank=True)
+	stages = models.JSONField(default=dict, blank=True)
+	result = models.JSONField(null=True, blank=True)
+	error = models.TextField(blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['status']),
+			models.Index(fields=['created_at']),
+		]
+
+	def __str__(self):
+		if self.sites is not None:
+			return f"{self.id} ({len(self.sites)} sites): {self.status}"
+		return f"{self.id} ({self.lat}, {self.lon}): {self.status}"
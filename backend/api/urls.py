@@ -3,5 +3,11 @@ from . import views
 
 urlpatterns = [
 	path('health/', views.health_check, name='health_check'),
-	path('search/', views.search_location, name='search_location')
+	path('ready/', views.readiness_check, name='readiness_check'),
+	path('metrics/', views.metrics, name='metrics'),
+	path('search/', views.search_location, name='search_location'),
+	path('search/batch/', views.search_batch, name='search_batch'),
+	path('search/<uuid:job_id>/', views.search_job, name='search_job'),
+	path('resume/<str:resume_id>/', views.resume, name='resume'),
+	path('resume/<str:resume_id>/stream/', views.resume_stream, name='resume_stream')
 ]
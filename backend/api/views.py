@@ -1,4 +1,6 @@
-from django.http import JsonResponse
+import json
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
@@ -16,8 +18,20 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'lib'))
 from lib.citysize import get_commune_info, categorie_ville
 from lib.worker import get_unemployed, get_job_offer_in_dep
 from lib.utils import geocode_adresse, get_city_from_coords
-from lib.OpenStreetMapGetter import Costia_getData_with_coordinates
+from lib.OpenStreetMapGetter import Costia_getData_with_coordinates, Costia_getData_batch
+# Same modules as the ones used by OpenStreetMapGetter, they hold the pending descriptions, caches and metrics
+import mistral
+import poi
+import readiness
+import resumecache
+import tilecache
+import tracing
+import logs
+
+logger = logs.get_logger(__name__)
 from .serializers import CitySearchResultSerializer
+from .models import SearchJob
+from . import jobs
 
 # Create your views here.
 
@@ -32,11 +46,38 @@ def health_check(request):
 		'message': 'API is running'
 	})
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def readiness_check(request):
+	"""
+	Ready once the reference data indexes are loaded and the communes
+	database has a snapshot, 503 before
+	"""
+	if not readiness.is_preloaded():
+		return JsonResponse({'status': 'loading'}, status=503)
+	version = readiness.snapshot_version()
+	if version is None:
+		return JsonResponse({
+			'status': 'no snapshot',
+			'message': 'Run python manage.py ingest',
+			'datasets': readiness.datasets()
+		}, status=503)
+	return JsonResponse({
+		'status': 'ready',
+		'snapshot': version,
+		'datasets': readiness.datasets()
+	})
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def search_location(request):
 	"""
-	Search for location data using real data from CSV files
+	Search for location data using real data from CSV files.
+	With "async": true the search is queued and its job id returned at once,
+	the job is then polled on /api/search/<job_id>/.
+	With "resume": false the stats are returned without waiting for the AI
+	summary, which is then fetched or streamed from /api/resume/<resume_id>/.
+	With "timings": true the milliseconds spent in each stage are added.
 	"""
 	try:
 		# Get search parameters from request
@@ -46,20 +87,160 @@ def search_location(request):
 			lat = coordinates.get('lat', 0)
 			lon = coordinates.get('lon', 0)
 
-			res = Costia_getData_with_coordinates(lat, lon)
+			if request.data.get('async', False):
+				job = jobs.submit(lat, lon)
+				return Response(
+					{'job_id': str(job.id), 'status': job.status, 'url': f'/api/search/{job.id}/'},
+					status=status.HTTP_202_ACCEPTED
+				)
+
+			with tracing.trace() as timings, tracing.span("search"):
+				res = Costia_getData_with_coordinates(lat, lon, with_resume=request.data.get('resume', True))
+			if request.data.get('timings', False) and isinstance(res, dict):
+				res['timings'] = {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
 
 			return Response(res, status=status.HTTP_200_OK)
 
 	except FileNotFoundError as e:
-		print(f"File not found: {e}")
+		logger.exception("File not found: %s", e)
+		return Response(
+			{'error': 'Data file not found', 'details': str(e)},
+			status=status.HTTP_500_INTERNAL_SERVER_ERROR
+		)
+	except Exception as e:
+		logger.exception("An error occurred: %s", e)
+		return Response(
+			{'error': 'An error occurred while processing your search', 'details': str(e)},
+			status=status.HTTP_500_INTERNAL_SERVER_ERROR
+		)
+	return Response({'error': 'Invalid request'}, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def search_batch(request):
+	"""
+	Scores a list of sites at once, without the AI summary.
+	Sites of the same commune share their commune and area lookups.
+	Batches of more than SEARCH_BATCH_SYNC_MAX_SITES sites, or with
+	"async": true, are queued and their job id returned at once, the job is
+	then polled on /api/search/<job_id>/ with the results of the communes
+	scored so far in its "communes" stage.
+	"""
+	try:
+		coordinates = request.data.get('coordinates', None)
+
+		if isinstance(coordinates, list) and coordinates:
+			if len(coordinates) > settings.SEARCH_BATCH_MAX_SITES:
+				return Response(
+					{'error': f'Too many sites, at most {settings.SEARCH_BATCH_MAX_SITES} per request'},
+					status=status.HTTP_400_BAD_REQUEST
+				)
+			try:
+				sites = [(float(site['lat']), float(site['lon'])) for site in coordinates]
+			except (KeyError, TypeError, ValueError) as e:
+				return Response({'error': 'Invalid request', 'details': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+			if request.data.get('async', False) or len(sites) > settings.SEARCH_BATCH_SYNC_MAX_SITES:
+				job = jobs.submit_batch(sites)
+				return Response(
+					{'job_id': str(job.id), 'status': job.status, 'url': f'/api/search/{job.id}/'},
+					status=status.HTTP_202_ACCEPTED
+				)
+
+			res = Costia_getData_batch(sites)
+
+			return Response({'results': res}, status=status.HTTP_200_OK)
+
+	except FileNotFoundError as e:
+		logger.exception("File not found: %s", e)
 		return Response(
 			{'error': 'Data file not found', 'details': str(e)},
 			status=status.HTTP_500_INTERNAL_SERVER_ERROR
 		)
 	except Exception as e:
-		print(f"An error occurred: {e}")
+		logger.exception("An error occurred: %s", e)
 		return Response(
 			{'error': 'An error occurred while processing your search', 'details': str(e)},
 			status=status.HTTP_500_INTERNAL_SERVER_ERROR
 		)
 	return Response({'error': 'Invalid request'}, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search_job(request, job_id):
+	"""
+	Status of an asynchronous search, with the results of its finished
+	stages and the final payload once done
+	"""
+	try:
+		job = SearchJob.objects.get(id=job_id)
+	except SearchJob.DoesNotExist:
+		return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+	return Response(jobs.as_dict(jobs.expire_if_stale(job)), status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def resume(request, resume_id):
+	"""
+	AI summary of a search made with "resume": false
+	"""
+	description = mistral.get_description(resume_id)
+	if description is None:
+		return Response({'error': 'Resume not found'}, status=status.HTTP_404_NOT_FOUND)
+	try:
+		return Response({'resume_id': resume_id, 'resume': mistral.getResume(description)}, status=status.HTTP_200_OK)
+	except Exception as e:
+		logger.exception("An error occurred: %s", e)
+		return Response(
+			{'error': 'An error occurred while generating the resume', 'details': str(e)},
+			status=status.HTTP_500_INTERNAL_SERVER_ERROR
+		)
+
+def _resume_events(description):
+	try:
+		for content in mistral.streamResume(description):
+			yield f"data: {json.dumps(content)}\n\n"
+		yield "event: end\ndata: {}\n\n"
+	except Exception as e:
+		logger.exception("An error occurred: %s", e)
+		yield f"event: error\ndata: {json.dumps(str(e))}\n\n"
+
+@require_GET
+def resume_stream(request, resume_id):
+	"""
+	Server-sent events streaming the AI summary as it is generated: one
+	JSON string per "data" event, then an "end" (or "error") event
+	"""
+	description = mistral.get_description(resume_id)
+	if description is None:
+		return JsonResponse({'error': 'Resume not found'}, status=404)
+	response = StreamingHttpResponse(_resume_events(description), content_type='text/event-stream')
+	response['Cache-Control'] = 'no-cache'
+	response['X-Accel-Buffering'] = 'no'
+	return response
+
+_METRIC_CACHES = (("tile", tilecache.cache), ("resume", resumecache.cache), ("area", poi.area_cache))
+
+def _cache_counters():
+	counters = {}
+	for name, cache in _METRIC_CACHES:
+		if cache is not None:
+			cache_stats = cache.stats()
+			counters[f"costia_{name}_cache_hits"] = (f"Hits of the {name} cache", cache_stats["hits"])
+			counters[f"costia_{name}_cache_misses"] = (f"Misses of the {name} cache", cache_stats["misses"])
+	return counters
+
+# Summed over the worker processes by tracing.render
+tracing.register_counters(_cache_counters)
+
+@require_GET
+def metrics(request):
+	"""
+	Prometheus metrics of every worker process: stage and upstream latencies,
+	cache hits. The cache entries are the ones seen by the process answering.
+	"""
+	gauges = {}
+	for name, cache in _METRIC_CACHES:
+		if cache is not None:
+			gauges[f"costia_{name}_cache_entries"] = (f"Entries of the {name} cache", cache.stats()["entries"])
+	return HttpResponse(tracing.render(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,212 @@
+"""
+Offline benchmark of the search pipeline.
+
+	python bench/benchmark.py record           # live calls, saves the upstream responses
+	python bench/benchmark.py run -n 20        # replays them, reports p50/p95 and allocations
+
+Run from backend/. The fixtures are not committed, they hold live third
+party responses: `record` once (network access and MISTRAL_API_KEY needed)
+writes them to bench/fixtures/upstream.json.gz, then `run` works offline.
+Overpass, Nominatim and api-adresse responses are served
+by a requests adapter mounted on the shared httpclient session, Mistral by a
+stand-in client, so that only our own code is measured. The tile and résumé
+caches are disabled, the geocoding and city area caches are cleared before each run unless
+--warm is given.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# Upstream responses must reach the pipeline on every run
+os.environ["OSM_TILE_CACHE_PATH"] = ""
+os.environ["RESUME_CACHE_PATH"] = ""
+os.environ.setdefault("POI_PROVIDER", "overpass")
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib'))
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+import httpclient
+import logs
+import mistral
+import OpenStreetMapGetter
+import poi
+import tracing
+import utils
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "upstream.json.gz")
+
+# One site per categorie_ville category
+SITES = [
+	("Metropolis", "Paris", 48.85661, 2.35222),
+	("Large_City", "Le Havre", 49.49438, 0.10794),
+	("Mid-sized_City", "Fécamp", 49.75782, 0.37470),
+	("Little_City", "Beuzeville", 49.34472, 0.34472),
+	("Village", "Saint-Maclou", 49.36333, 0.41528),
+]
+
+def request_key(method, url, body):
+	if isinstance(body, str):
+		body = body.encode("utf-8")
+	return hashlib.sha256(f"{method} {url}\n".encode("utf-8") + (body or b"")).hexdigest()
+
+class RecordingAdapter(HTTPAdapter):
+	"""Sends the requests and keeps their responses in fixtures"""
+
+	def __init__(self, fixtures, **kwargs):
+		super().__init__(**kwargs)
+		self.fixtures = fixtures
+
+	def send(self, request, **kwargs):
+		response = super().send(request, **kwargs)
+		self.fixtures["http"][request_key(request.method, request.url, request.body)] = {
+			"url": request.url,
+			"status": response.status_code,
+			"content_type": response.headers.get("Content-Type", ""),
+			"body": response.content.decode("utf-8"),
+		}
+		return response
+
+class ReplayAdapter(HTTPAdapter):
+	"""Answers the requests from fixtures, without any network access"""
+
+	def __init__(self, fixtures):
+		super().__init__()
+		self.fixtures = fixtures
+
+	def send(self, request, **kwargs):
+		entry = self.fixtures["http"].get(request_key(request.method, request.url, request.body))
+		if entry is None:
+			raise requests.ConnectionError(f"No recorded response for {request.method} {request.url}")
+		response = requests.Response()
+		response.status_code = entry["status"]
+		response.headers = CaseInsensitiveDict({"Content-Type": entry["content_type"]})
+		response._content = entry["body"].encode("utf-8")
+		response.encoding = "utf-8"
+		response.url = request.url
+		response.request = request
+		return response
+
+class _Completion:
+	def __init__(self, content):
+		self.choices = [type("Choice", (), {"message": type("Message", (), {"content": content})()})()]
+
+class MistralStandIn:
+	"""Chat client answering from the recorded completions, or recording the ones of `client`"""
+
+	def __init__(self, fixtures, client=None):
+		self.fixtures = fixtures
+		self.client = client
+		self.chat = self
+
+	def complete(self, model, messages):
+		key = request_key("CHAT", model, json.dumps(messages, sort_keys=True))
+		if self.client is not None:
+			self.fixtures["mistral"][key] = self.client.chat.complete(model=model, messages=messages).choices[0].message.content
+		if key not in self.fixtures["mistral"]:
+			raise requests.ConnectionError("No recorded Mistral completion")
+		return _Completion(self.fixtures["mistral"][key])
+
+def load_fixtures(path=FIXTURES_PATH):
+	if not os.path.exists(path):
+		sys.exit(f"No fixtures at {path}, record them first with `python bench/benchmark.py record`")
+	with gzip.open(path, "rt", encoding="utf-8") as f:
+		return json.load(f)
+
+def save_fixtures(fixtures, path=FIXTURES_PATH):
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	with gzip.open(path, "wt", encoding="utf-8") as f:
+		json.dump(fixtures, f, ensure_ascii=False, sort_keys=True)
+
+def clear_caches():
+	utils._geocode_cache.clear()
+	utils._reverse_geocode_cache.clear()
+	poi._area_ids.clear()
+	poi.area_cache.clear()
+
+def search(lat, lon):
+	return OpenStreetMapGetter.Costia_getData_with_coordinates(lat, lon)
+
+def record(args):
+	fixtures = {"http": {}, "mistral": {}}
+	adapter = RecordingAdapter(fixtures, pool_connections=httpclient.POOL_SIZE, pool_maxsize=httpclient.POOL_SIZE, max_retries=httpclient.session.get_adapter("https://").max_retries)
+	httpclient.session.mount("https://", adapter)
+	httpclient.session.mount("http://", adapter)
+	mistral.client = MistralStandIn(fixtures, mistral.client)
+	for category, city, lat, lon in SITES:
+		res = search(lat, lon)
+		found = res["stats"]["city_type"] if isinstance(res, dict) else res
+		print(f"{city}: recorded, city_type {found} (expected {category})")
+	save_fixtures(fixtures)
+	print(f"{len(fixtures['http'])} HTTP responses and {len(fixtures['mistral'])} completions saved to {FIXTURES_PATH}")
+
+def percentiles(values):
+	return np.percentile(values, 50) * 1000, np.percentile(values, 95) * 1000
+
+def run(args):
+	fixtures = load_fixtures()
+	adapter = ReplayAdapter(fixtures)
+	httpclient.session.mount("https://", adapter)
+	httpclient.session.mount("http://", adapter)
+	mistral.client = MistralStandIn(fixtures)
+
+	print(f"{'site':<16}{'city_type':<16}{'p50 ms':>10}{'p95 ms':>10}{'peak KiB':>10}{'alloc KiB':>11}")
+	for category, city, lat, lon in SITES:
+		totals = []
+		stages = {}
+		city_type = ""
+		for _ in range(args.warmup + args.iterations):
+			if not args.warm:
+				clear_caches()
+			with tracing.trace() as timings:
+				start = time.perf_counter()
+				res = search(lat, lon)
+				total = time.perf_counter() - start
+			if isinstance(res, dict):
+				city_type = res["stats"]["city_type"]
+			if _ >= args.warmup:
+				totals.append(total)
+				for stage, seconds in timings.items():
+					stages.setdefault(stage, []).append(seconds)
+
+		# Allocations are measured on a separate run, tracemalloc slows everything down
+		if not args.warm:
+			clear_caches()
+		tracemalloc.start()
+		before = tracemalloc.take_snapshot()
+		search(lat, lon)
+		after = tracemalloc.take_snapshot()
+		_, peak = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+		allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename") if stat.size_diff > 0)
+
+		p50, p95 = percentiles(totals)
+		print(f"{city:<16}{city_type or category:<16}{p50:>10.1f}{p95:>10.1f}{peak / 1024:>10.0f}{allocated / 1024:>11.0f}")
+		if args.stages:
+			for stage, values in sorted(stages.items()):
+				p50, p95 = percentiles(values)
+				print(f"  {stage:<30}{p50:>10.1f}{p95:>10.1f}")
+
+if __name__ == "__main__":
+	logs.configure()
+	parser = argparse.ArgumentParser(description="Offline benchmark of the search pipeline")
+	subparsers = parser.add_subparsers(dest="command", required=True)
+	subparsers.add_parser("record", help="call the live services and save their responses")
+	run_parser = subparsers.add_parser("run", help="replay the saved responses and time the pipeline")
+	run_parser.add_argument("-n", "--iterations", type=int, default=20)
+	run_parser.add_argument("--warmup", type=int, default=2)
+	run_parser.add_argument("--warm", action="store_true", help="keep the geocoding and city area caches between runs")
+	run_parser.add_argument("--no-stages", dest="stages", action="store_false", help="only report the end to end timings")
+	args = parser.parse_args()
+	if args.command == "record":
+		record(args)
+	else:
+		run(args)
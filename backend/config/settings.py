@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -50,6 +51,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
 	'django.middleware.security.SecurityMiddleware',
+	'api.middleware.CorrelationIdMiddleware',
 	'corsheaders.middleware.CorsMiddleware',  # CORS middleware
 	'django.middleware.common.CommonMiddleware',
 	'django.middleware.clickjacking.XFrameOptionsMiddleware',
@@ -137,3 +139,31 @@ REST_FRAMEWORK = {
 		'rest_framework.permissions.AllowAny',
 	],
 }
+
+# Maximum number of sites accepted by one batch search
+SEARCH_BATCH_MAX_SITES = int(os.environ.get('SEARCH_BATCH_MAX_SITES', 500))
+# Larger batches run as a job: their communes are scored one after another and
+# would run past the worker timeout, which only allows for one search
+SEARCH_BATCH_SYNC_MAX_SITES = int(os.environ.get('SEARCH_BATCH_SYNC_MAX_SITES', 10))
+
+# Number of asynchronous searches executed at the same time
+SEARCH_JOB_WORKERS = int(os.environ.get('SEARCH_JOB_WORKERS', 4))
+# Seconds without progress after which a pending or running search is failed,
+# the worker process running it was recycled or killed
+SEARCH_JOB_TIMEOUT = int(os.environ.get('SEARCH_JOB_TIMEOUT', 600))
+
+# Structured logs: one JSON object per line, with the correlation id of the request
+sys.path.append(str(BASE_DIR / 'lib'))
+LOGGING = {
+	'version': 1,
+	'disable_existing_loggers': False,
+	'formatters': {
+		'json': {'()': 'logs.JsonFormatter'},
+	},
+	'handlers': {
+		'console': {'class': 'logging.StreamHandler', 'formatter': 'json'},
+	},
+	'loggers': {
+		'costia': {'handlers': ['console'], 'level': os.environ.get('LOG_LEVEL', 'INFO').upper(), 'propagate': False},
+	},
+}
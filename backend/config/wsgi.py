@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+# lib/ is on the path once the settings are loaded. Under gunicorn with
+# preload_app, this runs in the master, before the workers are forked.
+import readiness
+
+readiness.preload()
@@ -0,0 +1,11 @@
+#!/bin/sh
+# Prepares the databases, then runs the command of the image (gunicorn by default)
+set -e
+
+python manage.py migrate --noinput
+# The communes database needs a snapshot, loaded from the CSVs of data/raw on
+# the first start. Without them the server still starts, /api/ready/ answers
+# 503 until `python manage.py ingest` has been run.
+python manage.py ingest --if-missing || echo "No communes snapshot loaded, run python manage.py ingest" >&2
+
+exec "$@"
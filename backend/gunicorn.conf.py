@@ -0,0 +1,50 @@
+"""
+Production server: `gunicorn -c gunicorn.conf.py config.wsgi:application`,
+run from backend/. The application, and the reference data it preloads, is
+loaded once in the master and shared copy-on-write by the forked workers.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+# Requests mostly wait on the upstream APIs, threads overlap that wait within a worker
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+preload_app = True
+
+# Longest search: the geocoding call, whose attempts are either its network
+# retries (FETCH_RETRIES) or its 429/504 retries (HTTP_RETRIES), never both,
+# then the concurrent upstream calls bounded by FETCH_TIMEOUT
+_attempts = max(int(os.environ.get("FETCH_RETRIES", 2)), int(os.environ.get("HTTP_RETRIES", 2))) + 1
+_upstream_timeout = (
+	_attempts * (float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5)) + float(os.environ.get("HTTP_READ_TIMEOUT", 30)))
+	+ float(os.environ.get("FETCH_TIMEOUT", 60))
+)
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", _upstream_timeout + 10))
+# Searches in flight when a worker is stopped or restarted are given the same time to finish
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", _upstream_timeout + 10))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+
+# Restarts the workers from time to time, jitter avoids restarting them all at once
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+# Metrics written by every worker and summed by /api/metrics/, see lib/tracing.py
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "costia-metrics"))
+
+def on_starting(server):
+	# The counters start again from zero with the server
+	shutil.rmtree(os.environ["METRICS_DIR"], ignore_errors=True)
+
+def worker_exit(server, worker):
+	# Keeps the last observations of a recycled worker
+	import tracing
+	tracing.flush()
+
+def child_exit(server, worker):
+	# Folds the metrics of the exited worker, killed ones included, into a single file
+	import tracing
+	tracing.mark_process_dead(worker.pid)
@@ -1,94 +1,25 @@
 import citysize
-import requests
 import worker
 import school
 import utils
 import Score
 import mistral
+import poi
+import profiles
+import tracing
+import logs
+import fetcher
+from functools import partial
 from io import StringIO
 # from . import TxttoPDF
 
+logger = logs.get_logger("OpenStreetMapGetter")
+
 def get_infos_nearby(lat, lon, info_type, info_filters=None, radius=500):
-	infos = []
-	overpass_url = "https://overpass-api.de/api/interpreter"
-	filters = list(info_filters) if info_filters else [None]
-	for info_filter in filters:
-		if info_filter:
-			search = f'["{info_type}"="{info_filter}"]'
-		else:
-			search = f'["{info_type}"]'
-		query = f"""
-		[out:json][timeout:25];
-		(
-		node{search}(around:{radius},{lat},{lon});
-		way{search}(around:{radius},{lat},{lon});
-		relation{search}(around:{radius},{lat},{lon});
-		);
-		out center;
-		"""
-		response = requests.post(overpass_url, data={"data": query})
-		data = response.json()
-		for element in data.get("elements", []):
-			name = element["tags"].get("name", "Inconnu")
-			type_value = element["tags"].get(info_type, "Autre")
-			if "lat" in element and "lon" in element:
-				lat_info, lon_info = element["lat"], element["lon"]
-			elif "center" in element:
-				lat_info, lon_info = element["center"]["lat"], element["center"]["lon"]
-			else:
-				continue
-			distance = utils.haversine(lat, lon, lat_info, lon_info)
-			infos.append({
-				"name": name,
-				"type": type_value,
-				"lat": lat_info,
-				"lon": lon_info,
-				"distance": distance
-			})
-	return infos
+	return poi.get_provider().get_infos_nearby(lat, lon, [(info_type, info_filters, radius)])[0]
 
 def get_infos_in_city_area(lat, lon, city, info_type, info_filters=None):
-	area_id = utils.get_area_id(city)
-	if not area_id :
-		return
-	infos = []
-	overpass_url = "https://overpass-api.de/api/interpreter"
-	filters = list(info_filters) if info_filters else [None]
-	for info_filter in filters:
-		if info_filter:
-			search = f'["{info_type}"="{info_filter}"]'
-		else:
-			search = f'["{info_type}"]'
-		query = f"""
-		[out:json][timeout:25];
-		area({area_id})->.searchArea;
-		(
-		node{search}(area.searchArea);
-		way{search}(area.searchArea);
-		relation{search}(area.searchArea);
-		);
-		out center;
-		"""
-		response = requests.post(overpass_url, data={"data": query})
-		data = response.json()
-		for element in data.get("elements", []):
-			name = element["tags"].get("name", "Inconnu")
-			type_value = element["tags"].get(info_type, "Autre")
-			if "lat" in element and "lon" in element:
-				lat_info, lon_info = element["lat"], element["lon"]
-			elif "center" in element:
-				lat_info, lon_info = element["center"]["lat"], element["center"]["lon"]
-			else:
-				continue
-			distance = utils.haversine(lat, lon, lat_info, lon_info)
-			infos.append({
-				"name": name,
-				"type": type_value,
-				"lat": lat_info,
-				"lon": lon_info,
-				"distance": distance
-			})
-	return infos
+	return poi.get_provider().get_infos_in_city_area(lat, lon, city, [(info_type, info_filters, 0)])[0]
 
 
 def print_stats_data(adresse, lat, lon, stats) :
@@ -114,109 +45,23 @@ def print_stats_data(adresse, lat, lon, stats) :
 	buffer.close()
 	return output
 
-def DataProvider(adresse, lat, lon) :
-	city = utils.get_city_from_coords(lat, lon)
-	stats = citysize.get_commune_info(city)
-	stats["city_type"] = citysize.categorie_ville(stats['population'], stats['densite'])
+def get_school_charge(profile, lat, lon, city, postcode=None) :
+	if not profile.school_charge_radius :
+		return school.school_charge_city(city, postcode)
+	for radius in profile.school_charge_radius :
+		school_charge = school.school_charge_radius(lat, lon, radius)
+		if school_charge != None :
+			break
+	return school_charge
 
-	if stats["city_type"] == "Metropolis" :
-		shop_radius = 500
-		transport_radius = 500
-		queries = [
-			("amenity", ["restaurant", "fast_food", "cafe", "bar", "pub"], "Shop", shop_radius),
-			("shop", ["clothes", "shoes", "jewelry", "electronics", "mobile_phone",
-			  "convenience", "bakery", "butcher", "deli", "greengrocer",
-			  "books", "gift", "hairdresser", "beauty", "optician",
-			  "sports", "toys"], "Shop", shop_radius),
-			("shop", ["supermarket"], "Food Store", 300),
-			("amenity", ["hospital"], "Hospital", 2000),
-			("amenity", ["clinic", "doctors"], "Healthcare", 1000),
-			("amenity", ["police", "fire_station"], "Public_Services", 2000),
-			("amenity", ["school"], "School", 500),
-			("highway", ["bus_stop"], "Transport", transport_radius),
-			("station", ["subway"], "Transport", transport_radius),
-			("railway", ["tram_stop"], "Transport", transport_radius),
-			("railway", ["station"], "Train_Station", transport_radius),
-		]
-	elif stats["city_type"] == "Large_City" :
-		shop_radius = 1000
-		transport_radius = 1000
-		queries = [
-			("amenity", ["restaurant", "fast_food", "cafe", "bar", "pub"], "Shop", shop_radius),
-			("shop", ["clothes", "shoes", "jewelry", "electronics", "mobile_phone",
-			  "convenience", "bakery", "butcher", "deli", "greengrocer",
-			  "books", "gift", "hairdresser", "beauty", "optician",
-			  "sports", "toys"], "Shop", shop_radius),
-			("shop", ["supermarket"], "Food Store", 500),
-			("amenity", ["hospital"], "Hospital", 2000),
-			("amenity", ["clinic", "doctors"], "Healthcare", 2000),
-			("amenity", ["police", "fire_station"], "Public_Services", 3000),
-			("amenity", ["school"], "School", transport_radius),
-			("highway", ["bus_stop"], "Transport", transport_radius),
-			("station", ["subway"], "Transport", transport_radius),
-			("railway", ["tram_stop"], "Transport", transport_radius),
-			("railway", ["station"], "Train_Station", transport_radius),
-		]
-	elif stats["city_type"] == "Mid-sized_City" :
-		shop_radius = 2000
-		transport_radius = 2000
-		queries = [
-			("amenity", ["restaurant", "fast_food", "cafe", "bar", "pub"], "Shop", shop_radius),
-			("shop", ["clothes", "shoes", "jewelry", "electronics", "mobile_phone",
-			  "convenience", "bakery", "butcher", "deli", "greengrocer",
-			  "books", "gift", "hairdresser", "beauty", "optician",
-			  "sports", "toys"], "Shop", shop_radius),
-			("shop", ["supermarket"], "Food Store", 0),
-			("amenity", ["hospital"], "Hospital", 0),
-			("amenity", ["clinic", "doctors"], "Healthcare", 0),
-			("amenity", ["police", "fire_station"], "Public_Services", 5000),
-			("amenity", ["school"], "School", 0),
-			("highway", ["bus_stop"], "Transport", transport_radius),
-			("station", ["subway"], "Transport", transport_radius),
-			("railway", ["tram_stop"], "Transport", transport_radius),
-			("railway", ["station"], "Train_Station", transport_radius),
-		]
-	elif stats["city_type"] == "Little_City" :
-		shop_radius = 3000
-		transport_radius = 3000
-		queries = [
-			("amenity", ["restaurant", "fast_food", "cafe", "bar", "pub"], "Shop", shop_radius),
-			("shop", ["clothes", "shoes", "jewelry", "electronics", "mobile_phone",
-			  "convenience", "bakery", "butcher", "deli", "greengrocer",
-			  "books", "gift", "hairdresser", "beauty", "optician",
-			  "sports", "toys"], "Shop", shop_radius),
-			("shop", ["supermarket"], "Food Store", 2000),
-			("amenity", ["hospital"], "Hospital", 5000),
-			("amenity", ["clinic", "doctors"], "Healthcare", 5000),
-			("amenity", ["police", "fire_station"], "Public_Services", 5000),
-			("amenity", ["school"], "School", 3000),
-			("highway", ["bus_stop"], "Transport", transport_radius),
-			("station", ["subway"], "Transport", transport_radius),
-			("railway", ["tram_stop"], "Transport", transport_radius),
-			("railway", ["station"], "Train_Station", transport_radius),
-		]
-	elif stats["city_type"] == "Village" :
-		shop_radius = 5000
-		transport_radius = 5000
-		queries = [
-			("amenity", ["restaurant", "fast_food", "cafe", "bar", "pub"], "Shop", shop_radius),
-			("shop", ["clothes", "shoes", "jewelry", "electronics", "mobile_phone",
-			  "convenience", "bakery", "butcher", "deli", "greengrocer",
-			  "books", "gift", "hairdresser", "beauty", "optician",
-			  "sports", "toys"], "Shop", shop_radius),
-			("shop", ["supermarket"], "Food Store", 5000),
-			("amenity", ["hospital"], "Hospital", 10000),
-			("amenity", ["clinic", "doctors"], "Healthcare", 10000),
-			("amenity", ["police", "fire_station"], "Public_Services", 10000),
-			("amenity", ["school"], "School", 5000),
-			("highway", ["bus_stop"], "Transport", transport_radius),
-			("station", ["subway"], "Transport", transport_radius),
-			("railway", ["tram_stop"], "Transport", transport_radius),
-			("railway", ["station"], "Train_Station", transport_radius),
-		]
-	else :
-		exit(0)
+def get_city_stats(city, citycode=None, postcode=None) :
+	"""Commune stats joined on the INSEE and postal codes of api-adresse, the city name when they are unknown"""
+	stats = citysize.get_commune_info(city, code_postal=postcode, code_insee=citycode)
+	stats["city_type"] = citysize.categorie_ville(stats['population'], stats['densite'])
+	return stats
 
+def add_site_stats(stats, profile, infos_by_query, worker_stats, school_charge) :
+	"""Adds the POI counts and distances, employment, school charge and scores of a site to stats"""
 	# 0 is city other is radius
 	shop_total_nbr = 0
 	shop_total_dist = 0
@@ -224,16 +69,9 @@ def DataProvider(adresse, lat, lon) :
 	transport_total_nbr = 0
 	transport_total_dist = 0
 
-
-	for info_type, info_filters, info_explicit, radius in queries:
+	for (info_type, info_filters, info_explicit, radius), infos in zip(profile.queries, infos_by_query):
 		total_dist = 0
 		nbr = 0
-		if radius == 0 :
-			infos = get_infos_in_city_area(lat, lon, city, info_type, info_filters)
-			# print("Looking in City :", city)
-		else :
-			infos = get_infos_nearby(lat, lon, info_type, info_filters, radius)
-			# print("Looking in radius :", radius, "m")
 		# print("Looking for :", info_explicit)
 		for info in infos:
 			# print(f"{info['name']} ({info['type']}) - {utils.reverse_geocode(info['lat'], info['lon'])} - {info['distance']:.0f} m")
@@ -260,42 +98,64 @@ def DataProvider(adresse, lat, lon) :
 	else:
 		transport_average = round(transport_total_dist / transport_total_nbr, 1)
 		stats["Transport_nbr"] = transport_total_nbr
-		stats["Transport_radius"] = transport_radius
+		stats["Transport_radius"] = profile.transport_radius
 		stats["Transport_average_distance"] = transport_average
 	if shop_total_nbr == 0:
 		shop_average = 0
 	else:
 		shop_average = round(shop_total_dist / shop_total_nbr, 1)
 		stats["Shop_nbr"] = shop_total_nbr
-		stats["Shop_radius"] = shop_radius
+		stats["Shop_radius"] = profile.shop_radius
 		stats["Shop_average_distance"] = shop_average
-	if stats["population"] >= 5000 :
-		stats["Unemployed_people"] = worker.get_unemployed(city)["nbr_unemployed"]
+	if worker_stats :
+		unemployed, job_offer = worker_stats
+		stats["Unemployed_people"] = unemployed["nbr_unemployed"]
 		if stats["population"] > 0:
-			stats["Proportion of unemployed"] = str(round((worker.get_unemployed(city)["nbr_unemployed"] * 100) / stats["population"])) + "%"
+			stats["Proportion of unemployed"] = str(round((unemployed["nbr_unemployed"] * 100) / stats["population"])) + "%"
 		else:
 			stats["Proportion of unemployed"] = "N/A"
-		stats["Job_Offer_in_Departement"] = worker.get_job_offer_in_dep(stats["departement"])["job_offer"]
-
-	if stats["city_type"] == "Metropolis" :
-		stats["School_Charge"] = school.school_charge_radius(lat, lon, 500)
-	elif stats["city_type"] == "Large_City" :
-		stats["School_Charge"] = school.school_charge_radius(lat, lon, 1000)
-	elif stats["city_type"] == "Mid-sized_City" :
-		stats["School_Charge"] = school.school_charge_city(city)
-	elif stats["city_type"] == "Little_City":
-		stats["School_Charge"] = school.school_charge_radius(lat, lon, 1500)
-		if stats["School_Charge"] == None :
-			stats["School_Charge"] = school.school_charge_radius(lat, lon, 3000)
-	elif stats["city_type"] == "Village" :
-		stats["School_Charge"] = school.school_charge_radius(lat, lon, 5000)
+		stats["Job_Offer_in_Departement"] = job_offer["job_offer"]
+
+	stats["School_Charge"] = school_charge
 
 	scores = Score.calculate_cost_score(stats)
 	for index, score in scores.items() :
 		stats[f"Score_{index}"] = str(score) + "/100"
 
+def DataProvider(adresse, lat, lon, on_stage=None, with_resume=True) :
+	"""
+	on_stage(stage, data) is called with the partial results of each stage
+	as soon as they are known: "city", "stats" then "resume".
+	Without with_resume the AI summary is not generated here, it is
+	requested afterwards with the returned resume_id.
+	"""
+	with tracing.span("city") :
+		address = utils.reverse_geocode_infos(lat, lon)
+	city, citycode, postcode = address["city"], address.get("citycode"), address.get("postcode")
+	with tracing.span("commune_stats") :
+		stats = get_city_stats(city, citycode, postcode)
+	if on_stage :
+		on_stage("city", dict(stats, adresse=adresse))
+	profile = profiles.get_profile(stats["city_type"])
 
-	formatted_output = print_stats_data(adresse, lat, lon, stats)
+	# Every lookup of the site is independent once the city is known, they run concurrently
+	with_workers = stats["population"] >= 5000
+	# Radius queries and city area queries are two separate provider lookups
+	provider = poi.get_provider()
+	calls = [
+		(tracing.traced("pois_nearby", provider.get_infos_nearby), lat, lon, profile.radius_queries),
+		(tracing.traced("pois_city_area", provider.get_infos_in_city_area), lat, lon, city, profile.area_queries),
+		(tracing.traced("school_charge", get_school_charge), profile, lat, lon, city, postcode),
+	]
+	if with_workers :
+		calls += [
+			(tracing.traced("unemployed", partial(worker.get_unemployed, code_insee=citycode)), city),
+			(tracing.traced("job_offers", partial(worker.get_job_offer_in_dep, code_insee=citycode)), stats["departement"]),
+		]
+	radius_infos, area_infos, school_charge, *worker_stats = fetcher.run_all(calls)
+	with tracing.span("scoring") :
+		add_site_stats(stats, profile, profile.merge_infos(radius_infos, area_infos), worker_stats, school_charge)
+		formatted_output = print_stats_data(adresse, lat, lon, stats)
 
 	clean_adresse = adresse.replace("/", "_").replace("\\", "_").replace(":", "_").replace(" ", "_")
 	filename = f"CostIAData_{lat},{lon}_{clean_adresse}.txt"
@@ -304,16 +164,92 @@ def DataProvider(adresse, lat, lon) :
 	# pdf_filename = f"PDF_report.pdf"
 	# TxttoPDF.text_to_pdf(formatted_output, pdf_filename)
 
-	print(stats)
-	print(formatted_output)
+	logs.dump(logger, "Site stats", lambda : {"stats": stats, "formatted_output": formatted_output})
+	resume_id = mistral.register(formatted_output)
+	if on_stage :
+		on_stage("stats", {'stats': stats, 'formatted_output': formatted_output, 'filename': filename, 'resume_id': resume_id})
+
+	resume = None
+	if with_resume :
+		with tracing.span("resume") :
+			resume = mistral.getResume(formatted_output)
+		if on_stage :
+			on_stage("resume", resume)
 
 	return {
 		'stats': stats,
 		'formatted_output': formatted_output,
-		'resume': mistral.getResume(formatted_output),
+		'resume': resume,
+		'resume_id': resume_id,
 		'filename': filename
 	}
 
+def with_distances(lat, lon, infos) :
+	return [dict(info, distance=utils.haversine(lat, lon, info["lat"], info["lon"])) for info in infos]
+
+def batch_commune_sites(provider, coordinates, addresses, results, city, citycode, postcode, indexes) :
+	"""Fills results with the stats of the sites at indexes, all in the same commune"""
+	try :
+		city_stats = get_city_stats(city, citycode, postcode)
+		profile = profiles.get_profile(city_stats["city_type"])
+		sites = [coordinates[index] for index in indexes]
+		first_lat, first_lon = sites[0]
+		calls = [
+			(provider.get_infos_in_city_area, first_lat, first_lon, city, profile.area_queries),
+			(provider.prefetch_nearby, sites, profile.radius_queries),
+		]
+		if city_stats["population"] >= 5000 :
+			calls += [
+				(partial(worker.get_unemployed, code_insee=citycode), city),
+				(partial(worker.get_job_offer_in_dep, code_insee=citycode), city_stats["departement"]),
+			]
+		area_infos, _, *worker_stats = fetcher.run_all(calls)
+	except Exception as e :
+		for index in indexes :
+			results[index] = {"lat": coordinates[index][0], "lon": coordinates[index][1], "error": str(e)}
+		return
+
+	for index, (lat, lon) in zip(indexes, sites) :
+		try :
+			stats = dict(city_stats)
+			radius_infos = provider.get_infos_nearby(lat, lon, profile.radius_queries)
+			infos = profile.merge_infos(radius_infos, [with_distances(lat, lon, area) for area in area_infos])
+			school_charge = get_school_charge(profile, lat, lon, city, postcode)
+			add_site_stats(stats, profile, infos, worker_stats, school_charge)
+			results[index] = {"adresse": addresses[index]["label"], "lat": lat, "lon": lon, "stats": stats}
+		except Exception as e :
+			results[index] = {"lat": lat, "lon": lon, "error": str(e)}
+
+def Costia_getData_batch(coordinates, on_stage=None) :
+	"""
+	Stats and scores of many (lat, lon) sites, in order. Sites are grouped
+	by commune: commune, employment and city area lookups run once per
+	commune, and the radius lookups of the commune sites are prefetched
+	together before being computed for each site. on_stage is called once
+	the sites are geocoded and after each commune, with the results so far.
+	"""
+	results = [None] * len(coordinates)
+	# A few sites at a time, a large batch would otherwise hold the whole fetch pool
+	addresses = fetcher.run_each([(utils.reverse_geocode_infos, lat, lon) for lat, lon in coordinates], max_in_flight=fetcher.BATCH_MAX_IN_FLIGHT)
+	sites_by_city = {}
+	for index, address in enumerate(addresses) :
+		if isinstance(address, Exception) :
+			logger.warning("Échec du géocodage inverse du site %s: %s", index, address)
+			results[index] = {"lat": coordinates[index][0], "lon": coordinates[index][1], "error": str(address) or type(address).__name__}
+		elif address["label"] == "Adresse inconnue" :
+			results[index] = {"lat": coordinates[index][0], "lon": coordinates[index][1], "error": "No data found for this address"}
+		else :
+			sites_by_city.setdefault((address["city"], address.get("citycode"), address.get("postcode")), []).append(index)
+	if on_stage :
+		on_stage("reverse_geocode", {"communes": len(sites_by_city)})
+
+	provider = poi.get_provider()
+	for done, ((city, citycode, postcode), indexes) in enumerate(sites_by_city.items(), 1) :
+		batch_commune_sites(provider, coordinates, addresses, results, city, citycode, postcode, indexes)
+		if on_stage :
+			on_stage("communes", {"done": done, "total": len(sites_by_city), "results": results})
+	return results
+
 def Create_score_system(adresse, lat, lon) :
 	data = DataProvider(adresse, lat, lon)
 
@@ -323,13 +259,15 @@ def Costia_getData_with_adresse(adresse) :
 		return "No data found for this address"
 	return DataProvider(adresse, lat, lon)
 
-def Costia_getData_with_coordinates(lat, lon) :
-	adresse = utils.reverse_geocode(lat, lon)
+def Costia_getData_with_coordinates(lat, lon, on_stage=None, with_resume=True) :
+	with tracing.span("reverse_geocode") :
+		adresse = utils.reverse_geocode(lat, lon)
 	if adresse == "Adresse inconnue" :
 		return "No data found for this address"
-	return DataProvider(adresse, lat, lon)
+	return DataProvider(adresse, lat, lon, on_stage, with_resume)
 
 if __name__ == "__main__":
+	logs.configure()
 	# adresse = "24ir9 fapfjal, 8ru2o"
 	adresse = "8 rue Riquet, 750000 Paris"
 	# adresse = "20 Quai Frissard, 76600 Le Havre"
@@ -1,4 +1,5 @@
-import pandas as pd
+import communedb
+import names
 
 def categorie_ville(population, densite):
 	if population < 2000 and densite < 150:
@@ -12,64 +13,28 @@ def categorie_ville(population, densite):
 	else:
 		return "Metropolis"
 
-def get_commune_info(nom_ville, csv_path="./data/raw/communes-france-2025.csv"):
-	df = pd.read_csv(csv_path, sep=None, engine='python')
-	def normalize(s):
-		if pd.isna(s):
-			return ""
-		return (
-			str(s)
-			.strip()
-			.lower()
-			.replace('-', ' ')
-			.replace('é', 'e')
-			.replace('è', 'e')
-			.replace('ê', 'e')
-			.replace('ë', 'e')
-			.replace('à', 'a')
-			.replace('â', 'a')
-			.replace('ä', 'a')
-			.replace('ã', 'a')
-			.replace('á', 'a')
-			.replace('ù', 'u')
-			.replace('û', 'u')
-			.replace('ü', 'u')
-			.replace('ú', 'u')
-			.replace('ô', 'o')
-			.replace('ö', 'o')
-			.replace('õ', 'o')
-			.replace('ó', 'o')
-			.replace('ò', 'o')
-			.replace('î', 'i')
-			.replace('ï', 'i')
-			.replace('í', 'i')
-			.replace('ì', 'i')
-			.replace('ç', 'c')
-			.replace('ñ', 'n')
-			.replace('ÿ', 'y')
-			.replace('ý', 'y')
-		)
-
-	nom_ville_norm = normalize(nom_ville)
-	df['NOM_COMMUNE_NORM'] = df['nom_sans_accent'].apply(normalize)
-
-	row = df[df['NOM_COMMUNE_NORM'] == nom_ville_norm]
-	if row.empty:
-		row = df[df['NOM_COMMUNE_NORM'].str.contains(nom_ville_norm)]
-	if not row.empty:
-		row = row.iloc[0]
+def get_commune_info(nom_ville, db_path=communedb.COMMUNES_DB_PATH, dep_code=None, code_postal=None, code_insee=None):
+	"""
+	Infos of the commune of code_insee when it is known, else of the one
+	named nom_ville, preferring the one of dep_code or code_postal between
+	homonyms
+	"""
+	row = communedb.find_by_code("communes", "code_insee", code_insee, db_path) if code_insee else None
+	if row is None:
+		row = communedb.find_commune(names.normalize(nom_ville), dep_code, code_postal, db_path)
+	if row is not None:
 		infos = {
 			"nom_ville": str(nom_ville),
-			"type_commune": str(row["typecom_texte"]),
-			"code_postal": str(int(row["code_postal"])) if not pd.isna(row["code_postal"]) else "",
+			"type_commune": str(row["typecom"]),
+			"code_postal": str(row["code_postal"] or ""),
 			"code_insee": str(row["code_insee"]),
-			"population": int(row["population"]) if not pd.isna(row["population"]) else None,
-			"superficie_km2": float(row["superficie_km2"]) if not pd.isna(row["superficie_km2"]) else None,
-			"densite": float(row["densite"]) if not pd.isna(row["densite"]) else None,
+			"population": row["population"],
+			"superficie_km2": row["area_km2"],
+			"densite": row["density"],
 			"departement": str(row["dep_nom"]),
 			"region": str(row["reg_nom"]),
-			"latitude": float(row["latitude_centre"]) if not pd.isna(row["latitude_centre"]) else None,
-			"longitude": float(row["longitude_centre"]) if not pd.isna(row["longitude_centre"]) else None,
+			"latitude": row["latitude"],
+			"longitude": row["longitude"],
 		}
 		return infos
 	else:
@@ -0,0 +1,137 @@
+import os
+import sqlite3
+import threading
+import names
+
+COMMUNES_DB_PATH = os.environ.get("COMMUNES_DB_PATH", "./data/data.sqlite3")
+# Bytes of the database read through a shared memory mapping rather than copied in each connection cache
+COMMUNES_DB_MMAP_SIZE = int(os.environ.get("COMMUNES_DB_MMAP_SIZE", 256 * 1024 * 1024))
+
+_local = threading.local()
+
+def connection(path=COMMUNES_DB_PATH):
+	"""
+	Read-only connection to the communes database built by `manage.py
+	ingest`, opened once per thread and per path
+	"""
+	connections = getattr(_local, "connections", None)
+	if connections is None:
+		connections = _local.connections = {}
+		_local.versions = {}
+	if path not in connections:
+		conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+		conn.row_factory = sqlite3.Row
+		conn.execute("PRAGMA query_only = ON")
+		conn.execute(f"PRAGMA mmap_size = {COMMUNES_DB_MMAP_SIZE}")
+		connections[path] = conn
+	return connections[path]
+
+def close():
+	"""Closes the connections of this thread, which must not be carried over a fork"""
+	for conn in getattr(_local, "connections", {}).values():
+		conn.close()
+	_local.connections = {}
+	_local.versions = {}
+
+def snapshot_table(name, version):
+	return f"{name}_v{version}" if version is not None else name
+
+def snapshot_directory_path(path, version):
+	# Columnar files of a snapshot, next to the database
+	return f"{path}-v{version}"
+
+def current_version(path=COMMUNES_DB_PATH):
+	"""
+	Version of the current snapshot, None for a database built before the
+	snapshots. It is read again only when another connection committed
+	since the last lookup.
+	"""
+	conn = connection(path)
+	data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+	cached = _local.versions.get(path)
+	if cached is None or cached[0] != data_version:
+		try:
+			row = conn.execute('SELECT "version" FROM "snapshot" WHERE "current" = 1').fetchone()
+		except sqlite3.OperationalError:
+			row = None
+		cached = _local.versions[path] = (data_version, row[0] if row else None)
+	return cached[1]
+
+def table(name, path=COMMUNES_DB_PATH):
+	"""Name of the table in the current snapshot"""
+	return snapshot_table(name, current_version(path))
+
+def snapshot_directory(path=COMMUNES_DB_PATH):
+	"""Directory of the memory-mappable files of the current snapshot, None when there is none"""
+	try:
+		version = current_version(path)
+	except sqlite3.Error:
+		return None
+	directory = snapshot_directory_path(path, version)
+	return directory if version is not None and os.path.isdir(directory) else None
+
+def _fts_phrase(text):
+	return '"' + text.replace('"', '""') + '"'
+
+# Candidate ranks, best first
+EXACT, SHORT_NAME, PREFIX, SUBSTRING = "exact", "short_name", "prefix", "substring"
+
+def find_communes(name_norm, dep_code=None, code_postal=None, limit=10, path=COMMUNES_DB_PATH):
+	"""
+	Communes matching the normalized name as (rank, row) pairs: same name,
+	same name without its article, names starting with it, then containing
+	it (trigram full text index). Within a rank, the communes of dep_code or
+	code_postal come first, then file order, so that homonyms like
+	"saint denis" always resolve the same way.
+	"""
+	conn = connection(path)
+	communes, communes_fts = table("communes", path), table("communes_fts", path)
+	short_norm = names.short_name(name_norm)
+	# Names are ASCII once normalized, so every name starting with name_norm sorts below this bound
+	conditions = [
+		(EXACT, '"name_norm" = ?', (name_norm,)),
+		(SHORT_NAME, '"short_norm" = ?', (short_norm,)),
+		(PREFIX, '"name_norm" >= ? AND "name_norm" < ?', (name_norm, name_norm + "\uffff")),
+	]
+	if len(name_norm) >= 3:
+		conditions.append((SUBSTRING, f'"rowid" IN (SELECT "rowid" FROM "{communes_fts}" WHERE "{communes_fts}" MATCH ?)', (_fts_phrase(name_norm),)))
+	else:
+		conditions.append((SUBSTRING, 'instr("name_norm", ?) > 0', (name_norm,)))
+
+	candidates = []
+	seen = set()
+	for rank, condition, params in conditions:
+		rows = conn.execute(
+			f'SELECT "rowid" AS "rowid", * FROM "{communes}" WHERE {condition} '
+			'ORDER BY ("dep_code" = ?) DESC, ("code_postal" = ?) DESC, "rowid" LIMIT ?',
+			params + (dep_code, code_postal, limit)
+		).fetchall()
+		for row in rows:
+			if row["rowid"] not in seen:
+				seen.add(row["rowid"])
+				candidates.append((rank, row))
+		if len(candidates) >= limit:
+			break
+	return candidates[:limit]
+
+def find_commune(name_norm, dep_code=None, code_postal=None, path=COMMUNES_DB_PATH):
+	"""Best candidate of find_communes, None when no commune matches"""
+	candidates = find_communes(name_norm, dep_code, code_postal, 1, path)
+	return candidates[0][1] if candidates else None
+
+def find_by_code(name, column, code, path=COMMUNES_DB_PATH):
+	"""First row of the table whose indexed code column is `code`"""
+	return connection(path).execute(f'SELECT * FROM "{table(name, path)}" WHERE "{column}" = ? ORDER BY "rowid" LIMIT 1', (code,)).fetchone()
+
+def find_by_name(name, name_norm, path=COMMUNES_DB_PATH):
+	"""
+	First row of the unemployed or job_offers table matching the normalized
+	name, then the short name (without postal code), then containing it
+	"""
+	conn = connection(path)
+	versioned = table(name, path)
+	for condition in ('"name_norm" = ?', '"short_norm" = ?', 'instr("name_norm", ?) > 0'):
+		row = conn.execute(f'SELECT * FROM "{versioned}" WHERE {condition} ORDER BY "rowid" LIMIT 1', (name_norm,)).fetchone()
+		if row is not None:
+			return row
+	return None
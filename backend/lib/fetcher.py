@@ -0,0 +1,90 @@
+import contextvars
+import itertools
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import requests
+
+MAX_WORKERS = int(os.environ.get("FETCH_MAX_WORKERS", 8))
+FETCH_TIMEOUT = float(os.environ.get("FETCH_TIMEOUT", 60))
+RETRIES = int(os.environ.get("FETCH_RETRIES", 2))
+BACKOFF = float(os.environ.get("FETCH_BACKOFF", 0.5))
+# Retried here: connection errors, timeouts and these statuses once raised by
+# raise_for_status. The httpclient session only retries 429 and 504 itself,
+# before the response reaches the caller.
+RETRY_STATUS = (502, 503)
+# Calls of a batch search in the pool at the same time, the rest of the pool
+# stays free for the interactive searches
+BATCH_MAX_IN_FLIGHT = int(os.environ.get("FETCH_BATCH_MAX_IN_FLIGHT", max(1, MAX_WORKERS // 2)))
+
+# Shared by every request of the process so that upstream concurrency stays bounded
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="fetch")
+
+def is_retryable(error):
+	if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+		return True
+	if isinstance(error, requests.HTTPError) and error.response is not None:
+		return error.response.status_code in RETRY_STATUS
+	return False
+
+def with_retries(func, *args, retries=RETRIES, backoff=BACKOFF, **kwargs):
+	"""
+	Calls func, retrying connection errors, timeouts and the HTTPError of
+	RETRY_STATUS responses with an exponential backoff and full jitter. 429
+	and 504 never get here as errors, the httpclient session retries them.
+	"""
+	for attempt in range(retries + 1):
+		try:
+			return func(*args, **kwargs)
+		except Exception as e:
+			if attempt == retries or not is_retryable(e):
+				raise
+			time.sleep(random.uniform(0, backoff * (2 ** attempt)))
+
+def run_all(calls, timeout=FETCH_TIMEOUT):
+	"""
+	Runs every (func, *args) call concurrently on the shared pool and returns
+	their results in the order of `calls`. The first exception is re-raised.
+	Calls must not wait on the pool themselves. They run in a copy of the
+	caller context, so that they belong to the caller trace.
+	"""
+	futures = [_executor.submit(contextvars.copy_context().run, call[0], *call[1:]) for call in calls]
+	deadline = time.monotonic() + timeout
+	return [future.result(timeout=max(0, deadline - time.monotonic())) for future in futures]
+
+def run_each(calls, timeout=FETCH_TIMEOUT, max_in_flight=None):
+	"""
+	Runs every (func, *args) call on the shared pool, at most max_in_flight
+	at a time, and returns for each call, in the order of `calls`, its result
+	or the exception it raised. A call not done `timeout` seconds after it
+	was queued gets a TimeoutError. Unlike run_all, a failing call does not
+	fail the others.
+	"""
+	results = [None] * len(calls)
+	queued = enumerate(calls)
+	running = {}
+
+	def submit():
+		for index, call in itertools.islice(queued, (max_in_flight or len(calls)) - len(running)):
+			future = _executor.submit(contextvars.copy_context().run, call[0], *call[1:])
+			running[future] = (index, time.monotonic() + timeout)
+
+	submit()
+	while running:
+		next_deadline = min(deadline for _, deadline in running.values())
+		done, _ = wait(running, timeout=max(0, next_deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+		now = time.monotonic()
+		for future, (index, deadline) in list(running.items()):
+			if future in done:
+				error = future.exception()
+				results[index] = error if error is not None else future.result()
+			elif deadline <= now:
+				# A call that already started keeps its pool thread until it returns
+				future.cancel()
+				results[index] = TimeoutError(f"No response after {timeout:g}s")
+			else:
+				continue
+			del running[future]
+		submit()
+	return results
@@ -0,0 +1,63 @@
+import os
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import tracing
+
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 30))
+POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 10))
+RETRIES = int(os.environ.get("HTTP_RETRIES", 2))
+# Statuses retried by the session, the other retryable failures are retried by fetcher.with_retries
+RETRY_STATUS = (429, 504)
+
+def _build_session():
+	retry = Retry(
+		total=None,
+		# Connection errors and timeouts are only retried by fetcher.with_retries,
+		# retrying them here too would multiply the attempts
+		connect=0,
+		read=0,
+		other=0,
+		status=RETRIES,
+		status_forcelist=RETRY_STATUS,
+		# Overpass queries are POSTed but read-only, they are safe to replay
+		allowed_methods=None,
+		backoff_factor=0.5,
+		respect_retry_after_header=True,
+		raise_on_status=False,
+	)
+	# One pool of up to POOL_SIZE keep-alive connections per upstream host
+	adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+	session = requests.Session()
+	session.mount("https://", adapter)
+	session.mount("http://", adapter)
+	session.headers.update({
+		"Accept-Encoding": "gzip, deflate",
+		"User-Agent": "UntecWow/1.0",
+	})
+	return session
+
+# Shared by every outbound call of the process
+session = _build_session()
+
+def _request(method, url, **kwargs):
+	kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+	start = time.monotonic()
+	try:
+		response = session.request(method, url, **kwargs)
+	except Exception as e:
+		tracing.observe_upstream(url, time.monotonic() - start, type(e).__name__)
+		raise
+	# Reading content here keeps the body download in the measured duration
+	response_bytes = len(response.content)
+	body = response.request.body
+	tracing.observe_upstream(url, time.monotonic() - start, response.status_code, len(body) if body else 0, response_bytes)
+	return response
+
+def get(url, **kwargs):
+	return _request("GET", url, **kwargs)
+
+def post(url, **kwargs):
+	return _request("POST", url, **kwargs)
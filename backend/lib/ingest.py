@@ -0,0 +1,246 @@
+import collections
+import csv
+import operator
+import shutil
+import sqlite3
+import time
+import numpy as np
+import communedb
+import names
+import refdata
+
+# Snapshots left in the database after a load, the previous one stays readable by the requests still using it
+SNAPSHOTS_KEPT = 2
+
+SCHEMA = {
+	"communes": (
+		'("code_insee" TEXT, "code_postal" TEXT, "dep_code" TEXT, "dep_nom" TEXT, "reg_nom" TEXT, "typecom" TEXT, '
+		'"displayname" TEXT, "name" TEXT, "name_norm" TEXT, "short_norm" TEXT, "area_km2" REAL, "density" REAL, '
+		'"population" INTEGER, "latitude" REAL, "longitude" REAL, '
+		'"unemployed" INTEGER DEFAULT NULL, "job_offers" INTEGER DEFAULT NULL)'
+	),
+	"unemployed": '("commune" TEXT, "name_norm" TEXT, "short_norm" TEXT, "code_postal" TEXT, "nbr" INTEGER)',
+	"job_offers": '("departement" TEXT, "name_norm" TEXT, "short_norm" TEXT, "dep_code" TEXT, "nbr" INTEGER)',
+	"schools": (
+		'("commune" TEXT, "total_stud" INTEGER, "nbr_stud_actual" INTEGER, "nbr_classe" INTEGER, '
+		'"lat_school" REAL, "lon_school" REAL)'
+	),
+}
+
+INDEXES = {
+	"communes": ("name_norm", "short_norm", "code_insee", "code_postal"),
+	"unemployed": ("name_norm", "short_norm", "code_postal"),
+	"job_offers": ("name_norm", "short_norm", "dep_code"),
+	"schools": (),
+}
+
+# Tables of the databases built before the snapshots
+LEGACY_TABLES = ("communes_fts", "communes", "unemployed", "job_offers")
+
+def to_int(value):
+	try:
+		return int(str(value).replace(' ', ''))
+	except (TypeError, ValueError):
+		return None
+
+def to_float(value):
+	try:
+		return float(value)
+	except (TypeError, ValueError):
+		return None
+
+def _read(path, delimiter, columns):
+	"""Tuples of the given columns of every CSV row, None for the missing values as with csv.DictReader"""
+	with open(path, "r", encoding="utf-8", newline="") as f:
+		reader = csv.reader(f, delimiter=delimiter)
+		header = next(reader)
+		width = len(header)
+		# Missing columns read the padding cell of each row
+		getter = operator.itemgetter(*[header.index(column) if column in header else width for column in columns])
+		padding = [None] * (width + 1)
+		for row in reader:
+			if row:
+				yield getter(row + padding[len(row):])
+
+def unemployed_rows(path, by_code, by_name):
+	"""
+	Rows of Unemployed.csv ("Name 12345";nbr), filling the counts by
+	(postal code, short name) and by postal code, None for the postal codes
+	of several rows
+	"""
+	for commune, nbr in _read(path, ";", ("Commune", "nbr")):
+		commune = commune.strip()
+		code_postal = commune.split(' ')[-1]
+		nbr = to_int(nbr)
+		short_norm = names.normalize(refdata.extract_ville_name(commune))
+		# Shared postal codes get no count by code, they would give one commune the count of another
+		by_code[code_postal] = None if code_postal in by_code else nbr or 0
+		by_name[(code_postal, short_norm)] = nbr or 0
+		yield commune, names.normalize(commune), short_norm, code_postal, nbr
+
+def job_offers_rows(path, by_code):
+	"""Rows of JobOffer.csv ("Name 01";nbr), filling the counts by department code"""
+	for departement, nbr in _read(path, ";", ("Departement", "nbr")):
+		departement = departement.strip()
+		dep_code = departement.split(' ')[-1]
+		nbr = to_int(nbr)
+		by_code[dep_code] = nbr or 0
+		short_norm = names.normalize(refdata.extract_ville_name(departement))
+		yield departement, names.normalize(departement), short_norm, dep_code, nbr
+
+def communes_rows(path, unemployed_by_code, unemployed_by_name, job_offers_by_code):
+	"""
+	Rows of communes-france-2025.csv, joined to the unemployment count of
+	their postal code and name and to the job offers of their department.
+	When no name matches, the count of the postal code is only used if this
+	commune and one row of Unemployed.csv are the only ones with that code,
+	else it is NULL and the lookups fall back to the name.
+	"""
+	# A single column is read as a bare value
+	communes_by_code = collections.Counter(_read(path, ",", ("code_postal",)))
+	columns = ("code_insee", "code_postal", "dep_code", "dep_nom", "reg_nom", "typecom_texte", "nom_standard",
+		"nom_sans_accent", "superficie_km2", "densite", "population", "latitude_centre", "longitude_centre")
+	for row in _read(path, ",", columns):
+		code_insee, code_postal, dep_code, dep_nom, reg_nom, typecom, displayname, name = row[:8]
+		area, density, population, latitude, longitude = row[8:]
+		name_norm = names.normalize(name)
+		unemployed_by_shared_code = unemployed_by_code.get(code_postal) if communes_by_code[code_postal] == 1 else None
+		yield (
+			code_insee, code_postal, dep_code, dep_nom, reg_nom, typecom, displayname, name,
+			name_norm,
+			names.short_name(name_norm),
+			to_float(area),
+			to_float(density),
+			to_int(population),
+			to_float(latitude),
+			to_float(longitude),
+			unemployed_by_name.get((code_postal, name_norm), unemployed_by_shared_code),
+			job_offers_by_code.get(dep_code),
+		)
+
+def schools_rows(path):
+	"""Rows of School.csv, the coordinates being optional"""
+	columns = ("Commune", "total_stud", "nbr_stud_actual", "nbr_classe", "lat_school", "lon_school")
+	for commune, total_stud, nbr_stud_actual, nbr_classe, lat, lon in _read(path, ";", columns):
+		yield (
+			commune.strip(), to_int(total_stud), to_int(nbr_stud_actual), to_int(nbr_classe),
+			to_float(lat), to_float(lon),
+		)
+
+def _insert(conn, name, table, rows):
+	columns = SCHEMA[name].count('"') // 2
+	cursor = conn.executemany(f'INSERT INTO "{table}" VALUES ({", ".join("?" * columns)})', rows)
+	return cursor.rowcount
+
+def write_schools(conn, table, directory):
+	"""Columnar copy of the schools table, memory-mapped by the workers through refdata.LookupTable.from_snapshot"""
+	rows = conn.execute(
+		'SELECT "commune", "total_stud", "nbr_stud_actual", "nbr_classe", "lat_school", "lon_school" '
+		f'FROM "{table}" ORDER BY "rowid"'
+	).fetchall()
+	communes, total_stud, nbr_stud_actual, nbr_classe, lat, lon = zip(*rows) if rows else ((),) * 6
+	keys, key_ids = refdata.intern(communes)
+	counts = lambda values: np.nan_to_num(np.array(values, dtype=float)).astype(np.int64)
+	refdata.save_table(directory, "schools", "Commune", keys, key_ids, {
+		"total_stud": counts(total_stud),
+		"nbr_stud_actual": counts(nbr_stud_actual),
+		"nbr_classe": counts(nbr_classe),
+		"lat_school": np.array(lat, dtype=float),
+		"lon_school": np.array(lon, dtype=float),
+	})
+
+def load(db_path, communes_path, unemployed_path, job_offers_path, schools_path=None):
+	"""
+	Loads the CSVs in a new snapshot of the database and makes it current,
+	in one transaction. Readers keep using the previous snapshot until the
+	commit, WAL lets them read during the whole load. The schools are also
+	written as memory-mappable columns next to the database, without
+	schools_path the snapshot has none and the school lookups return None.
+	Returns the version and the row count of each table.
+	"""
+	dropped = []
+	directory = None
+	conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+	try:
+		conn.execute("PRAGMA journal_mode=WAL")
+		conn.execute("PRAGMA synchronous=NORMAL")
+		conn.execute("PRAGMA temp_store=MEMORY")
+		conn.execute("PRAGMA cache_size=-65536")
+		conn.execute("BEGIN IMMEDIATE")
+		try:
+			conn.execute(
+				'CREATE TABLE IF NOT EXISTS "snapshot" '
+				'("version" INTEGER PRIMARY KEY, "loaded_at" REAL NOT NULL, "current" INTEGER NOT NULL DEFAULT 0)'
+			)
+			version = conn.execute('SELECT COALESCE(MAX("version"), 0) + 1 FROM "snapshot"').fetchone()[0]
+			tables = {name: communedb.snapshot_table(name, version) for name in SCHEMA}
+			for name, table in tables.items():
+				conn.execute(f'CREATE TABLE "{table}" {SCHEMA[name]}')
+
+			unemployed_by_code, unemployed_by_name, job_offers_by_code = {}, {}, {}
+			counts = {
+				"unemployed": _insert(
+					conn, "unemployed", tables["unemployed"],
+					unemployed_rows(unemployed_path, unemployed_by_code, unemployed_by_name),
+				),
+				"job_offers": _insert(
+					conn, "job_offers", tables["job_offers"], job_offers_rows(job_offers_path, job_offers_by_code)
+				),
+			}
+			counts["communes"] = _insert(
+				conn, "communes", tables["communes"],
+				communes_rows(communes_path, unemployed_by_code, unemployed_by_name, job_offers_by_code),
+			)
+			counts["schools"] = 0
+			if schools_path:
+				counts["schools"] = _insert(conn, "schools", tables["schools"], schools_rows(schools_path))
+
+			# Indexes are built once the rows are in, which is faster than maintaining them on every insert
+			for name, columns in INDEXES.items():
+				for column in columns:
+					conn.execute(f'CREATE INDEX "{tables[name]}_{column}" ON "{tables[name]}" ("{column}")')
+			fts = communedb.snapshot_table("communes_fts", version)
+			conn.execute(
+				f'CREATE VIRTUAL TABLE "{fts}" USING fts5("name_norm", '
+				f'content="{tables["communes"]}", tokenize="trigram")'
+			)
+			# In rowid order, the covering name_norm index would otherwise feed the full text index out of order
+			conn.execute(
+				f'INSERT INTO "{fts}" ("rowid", "name_norm") '
+				f'SELECT "rowid", "name_norm" FROM "{tables["communes"]}" ORDER BY "rowid"'
+			)
+			# Written before the commit, so that the files are there as soon as the version is current
+			if schools_path:
+				directory = communedb.snapshot_directory_path(db_path, version)
+				write_schools(conn, tables["schools"], directory)
+
+			conn.execute('UPDATE "snapshot" SET "current" = 0')
+			conn.execute(
+				'INSERT INTO "snapshot" ("version", "loaded_at", "current") VALUES (?, ?, 1)', (version, time.time())
+			)
+			old_versions = conn.execute(
+				'SELECT "version" FROM "snapshot" WHERE "version" <= ?', (version - SNAPSHOTS_KEPT,)
+			).fetchall()
+			for old_version, in old_versions:
+				drop_snapshot(conn, old_version)
+				dropped.append(old_version)
+			for table in LEGACY_TABLES:
+				conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+			conn.execute("COMMIT")
+		except BaseException:
+			conn.execute("ROLLBACK")
+			if directory:
+				shutil.rmtree(directory, ignore_errors=True)
+			raise
+	finally:
+		conn.close()
+	# Workers still mapping these files keep reading them until they switch, the pages are freed afterwards
+	for old_version in dropped:
+		shutil.rmtree(communedb.snapshot_directory_path(db_path, old_version), ignore_errors=True)
+	return version, counts
+
+def drop_snapshot(conn, version):
+	conn.execute(f'DROP TABLE IF EXISTS "{communedb.snapshot_table("communes_fts", version)}"')
+	for name in SCHEMA:
+		conn.execute(f'DROP TABLE IF EXISTS "{communedb.snapshot_table(name, version)}"')
+	conn.execute('DELETE FROM "snapshot" WHERE "version" = ?', (version,))
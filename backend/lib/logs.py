@@ -0,0 +1,63 @@
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# Share of the payload dumps actually logged when DEBUG is enabled, from 0 to 1
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get("LOG_PAYLOAD_SAMPLE_RATE", 0))
+
+# Id of the request being served, shared with the threads of fetcher.run_all
+correlation_id = contextvars.ContextVar("correlation_id", default=None)
+
+class JsonFormatter(logging.Formatter):
+	"""
+	One JSON object per line. The message is only formatted here, once the
+	record passed the level checks, with the `fields` given as extra.
+	"""
+
+	def format(self, record):
+		entry = {
+			"ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+			"level": record.levelname,
+			"logger": record.name,
+			"msg": record.getMessage(),
+		}
+		request_id = correlation_id.get()
+		if request_id:
+			entry["correlation_id"] = request_id
+		entry.update(getattr(record, "fields", {}))
+		if record.exc_info:
+			entry["exc_info"] = self.formatException(record.exc_info)
+		return json.dumps(entry, ensure_ascii=False, default=str)
+
+def get_logger(name):
+	return logging.getLogger(f"costia.{name}")
+
+def configure():
+	"""JSON lines on stderr for the costia loggers, when nothing else configured them"""
+	logger = logging.getLogger("costia")
+	if not logger.handlers:
+		handler = logging.StreamHandler(sys.stderr)
+		handler.setFormatter(JsonFormatter())
+		logger.addHandler(handler)
+		logger.setLevel(LOG_LEVEL)
+		logger.propagate = False
+
+def new_correlation_id(value=None):
+	"""Sets the correlation id of the current context, a new one by default, and returns it"""
+	value = value or uuid.uuid4().hex
+	correlation_id.set(value)
+	return value
+
+def dump(logger, message, payload):
+	"""
+	Logs payload() at DEBUG for LOG_PAYLOAD_SAMPLE_RATE of the calls. payload
+	is a callable, so nothing is built when the dump is not logged.
+	"""
+	if LOG_PAYLOAD_SAMPLE_RATE > 0 and logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_PAYLOAD_SAMPLE_RATE:
+		logger.debug(message, extra={"fields": {"payload": payload()}})
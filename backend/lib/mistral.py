@@ -1,16 +1,34 @@
 import os
+import hashlib
+import time
 from mistralai import Mistral
+import resumecache
+import tracing
+import ttlcache
 
 mistralKey = os.environ.get('MISTRAL_API_KEY', 'default_api_key')
 client = Mistral(api_key=mistralKey)
+# The Mistral client has its own HTTP stack, its calls are reported under this host
+MISTRAL_URL = "https://api.mistral.ai"
 
-def getResume(data):
-	chat_response = client.chat.complete(
-		model= "mistral-large-latest",
-		messages = [
-			{
-				"role": "user",
-				"content": f"""
+MODEL = "mistral-large-latest"
+# Bump when PROMPT changes so that the cached résumés of the previous prompt are not reused
+PROMPT_VERSION = 2
+# Lines of the description naming the site. They are left out of the prompt,
+# and so of the cache key, so that sites with the same stats share a résumé
+# that cannot quote the address of another one.
+SITE_LINES = ("Adresse :", "Coordinates :")
+# Descriptions waiting for their résumé, keyed by resume_id. They are kept
+# next to the résumés so that any worker process can serve the résumé of a
+# search answered by another one, in memory when the résumé cache is disabled.
+RESUME_TTL = int(os.environ.get('RESUME_TTL', 3600))
+RESUME_PENDING_SIZE = int(os.environ.get('RESUME_PENDING_SIZE', 1024))
+if resumecache.RESUME_CACHE_PATH:
+	_descriptions = resumecache.ResumeCache(ttl=RESUME_TTL, max_entries=RESUME_PENDING_SIZE, table="descriptions")
+else:
+	_descriptions = ttlcache.TTLCache(max_entries=RESUME_PENDING_SIZE, ttl=RESUME_TTL)
+
+PROMPT = """
 				You are a professional, pragmatic, objective, and courteous real estate analyst.
 				Based on the following construction site description, assess the viability of a residential building project at that location.
 				Your evaluation should consider all factors mentioned in the location description, assessing their direct or indirect impact on the residential project (quality of life, appeal, accessibility, future value, etc.).
@@ -32,8 +50,74 @@ def getResume(data):
 
 				Here is the location description:
 				{data}
-				""",
-			},
-		]
-	)
-	return chat_response.choices[0].message.content
+				"""
+
+def site_stats(data):
+	"""Description without its address and coordinates lines"""
+	return "\n".join(line for line in data.splitlines() if not line.startswith(SITE_LINES))
+
+def _messages(data):
+	return [
+		{
+			"role": "user",
+			"content": PROMPT.format(data=data),
+		},
+	]
+
+def getResume(data, chat_client=None, cache=resumecache.cache):
+	"""
+	Résumé of the description, served from the résumé cache when the same
+	stats were already summarized with the same model and prompt, whatever
+	the address
+	"""
+	data = site_stats(data)
+	key = resumecache.resume_key(MODEL, PROMPT_VERSION, data)
+	resume = cache.get(key) if cache else None
+	if resume is None:
+		start = time.monotonic()
+		with tracing.span("mistral"):
+			chat_response = (chat_client or client).chat.complete(
+				model=MODEL,
+				messages=_messages(data)
+			)
+		resume = chat_response.choices[0].message.content
+		tracing.observe_upstream(MISTRAL_URL, time.monotonic() - start, 200, len(data.encode("utf-8")), len(resume.encode("utf-8")))
+		if cache:
+			cache.set(key, resume)
+	return resume
+
+def streamResume(data, chat_client=None, cache=resumecache.cache):
+	"""Yields the résumé of the description piece by piece, as the completion is generated"""
+	data = site_stats(data)
+	key = resumecache.resume_key(MODEL, PROMPT_VERSION, data)
+	resume = cache.get(key) if cache else None
+	if resume is not None:
+		yield resume
+		return
+	contents = []
+	start = time.monotonic()
+	for event in (chat_client or client).chat.stream(model=MODEL, messages=_messages(data)):
+		content = event.data.choices[0].delta.content
+		if content:
+			contents.append(content)
+			yield content
+	resume = "".join(contents)
+	tracing.observe_upstream(MISTRAL_URL, time.monotonic() - start, 200, len(data.encode("utf-8")), len(resume.encode("utf-8")))
+	# Only complete résumés are cached, an interrupted stream never reaches this point
+	if cache:
+		cache.set(key, resume)
+
+def resume_id(data):
+	return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+def register(data):
+	"""
+	Keeps the description so that its résumé can be requested later by the
+	returned id, without blocking the stats response on the completion
+	"""
+	key = resume_id(data)
+	_descriptions.set(key, data)
+	return key
+
+def get_description(key):
+	return _descriptions.get(key)
@@ -0,0 +1,23 @@
+import math
+import re
+import unicodedata
+
+# Letters that NFKD does not decompose into ASCII
+_LIGATURES = str.maketrans({"œ": "oe", "Œ": "OE", "æ": "ae", "Æ": "AE", "ß": "ss"})
+_SEPARATORS = re.compile(r"[\s\-'’]+")
+_ARTICLE = re.compile(r"^(?:le|la|les|l) ")
+
+def normalize(text):
+	"""
+	Shared form of the commune, department and school names: lower case,
+	without accents, hyphens and apostrophes as single spaces
+	"""
+	if text is None or (isinstance(text, float) and math.isnan(text)):
+		return ""
+	text = unicodedata.normalize("NFKD", str(text).translate(_LIGATURES))
+	text = text.encode("ascii", "ignore").decode("ascii").lower()
+	return _SEPARATORS.sub(" ", text).strip()
+
+def short_name(name_norm):
+	"""Normalized name without its leading article, "le havre" -> "havre\""""
+	return _ARTICLE.sub("", name_norm)
@@ -0,0 +1,270 @@
+import functools
+import os
+import fetcher
+import httpclient
+import tilecache
+import utils
+
+OVERPASS_URL = "https://overpass-api.de/api/interpreter"
+# Connect / read timeouts in seconds, the read one matches the [timeout:25] of the queries
+OVERPASS_TIMEOUT = (float(os.environ.get("OVERPASS_CONNECT_TIMEOUT", 5)), float(os.environ.get("OVERPASS_READ_TIMEOUT", 30)))
+REGEX_SPECIAL_CHARS = set(".[]()*+?{}|^$\\")
+
+def _regex_escape(value):
+	# Overpass QL unescapes the string once before compiling the regex
+	return "".join("\\\\" + c if c in REGEX_SPECIAL_CHARS else c for c in str(value))
+
+def tag_filter(info_type, info_filters=None):
+	"""
+	Builds the Overpass tag filter matching any of the given values,
+	as a regex when several values share the same key
+	"""
+	values = sorted(set(info_filters)) if info_filters else []
+	if not values:
+		return f'["{info_type}"]'
+	if len(values) == 1:
+		return f'["{info_type}"="{values[0]}"]'
+	pattern = "|".join(_regex_escape(value) for value in values)
+	return f'["{info_type}"~"^({pattern})$"]'
+
+def _merge_filters(queries, indexes):
+	# One tag filter per key: a key queried without filter matches every value
+	merged = {}
+	for index in indexes:
+		info_type, info_filters = queries[index][0], queries[index][1]
+		if not info_filters or merged.get(info_type, []) is None:
+			merged[info_type] = None
+		else:
+			merged.setdefault(info_type, []).extend(info_filters)
+	return merged
+
+def plan_queries(queries, area_id=None):
+	"""
+	Groups (info_type, info_filters, radius) queries by radius, radius 0
+	meaning the whole city area. Returns the list of (radius, query indexes)
+	groups in the order they are emitted in the union query.
+	"""
+	groups = {}
+	for index, (info_type, info_filters, radius) in enumerate(queries):
+		if radius == 0 and not area_id:
+			continue
+		groups.setdefault(radius, []).append(index)
+	return sorted(groups.items(), key=lambda group: (group[0] == 0, group[0]))
+
+@functools.lru_cache(maxsize=256)
+def compile_groups(queries, with_area):
+	"""
+	plan_queries groups of a tuple of queries with the merged tag filters of
+	each group, as (radius, query indexes, tag filters). Cached, so the
+	groups of a city profile are only built once.
+	"""
+	return tuple(
+		(radius, tuple(indexes), tuple(tag_filter(info_type, info_filters) for info_type, info_filters in _merge_filters(queries, indexes).items()))
+		for radius, indexes in plan_queries(queries, with_area)
+	)
+
+def _hashable(queries):
+	return tuple((info_type, tuple(info_filters) if info_filters else None, radius) for info_type, info_filters, radius in queries)
+
+def build_union_query(lat, lon, queries, area_id=None):
+	"""
+	Builds a single Overpass QL request covering every query. Each radius
+	group is printed as its own set followed by `out count;`, whose count
+	element lets split_elements know which group the elements came from.
+	"""
+	compiled = compile_groups(_hashable(queries), bool(area_id))
+	lines = ["[out:json][timeout:25];"]
+	if area_id and any(radius == 0 for radius, _, _ in compiled):
+		lines.append(f"area({area_id})->.searchArea;")
+	for radius, _, filters in compiled:
+		if radius == 0:
+			scope = "(area.searchArea)"
+		else:
+			scope = f"(around:{radius},{lat},{lon})"
+		lines.append("(")
+		for tag_filters in filters:
+			lines.append(f"nwr{tag_filters}{scope};")
+		lines.append(");")
+		lines.append("out center;")
+		lines.append("out count;")
+	return "\n".join(lines), [(radius, indexes) for radius, indexes, _ in compiled]
+
+def element_info(lat, lon, element, info_type):
+	if "lat" in element and "lon" in element:
+		lat_info, lon_info = element["lat"], element["lon"]
+	elif "center" in element:
+		lat_info, lon_info = element["center"]["lat"], element["center"]["lon"]
+	else:
+		return None
+	return {
+		"name": element["tags"].get("name", "Inconnu"),
+		"type": element["tags"].get(info_type, "Autre"),
+		"lat": lat_info,
+		"lon": lon_info,
+		"distance": utils.haversine(lat, lon, lat_info, lon_info)
+	}
+
+def _matches(element, info_type, info_filters):
+	value = element.get("tags", {}).get(info_type)
+	if value is None:
+		return False
+	return not info_filters or value in info_filters
+
+def split_elements(lat, lon, elements, queries, groups):
+	"""
+	Splits the elements of a union response back into one list of infos
+	per query, in the order of `queries`
+	"""
+	results = [[] for _ in queries]
+	group_index = 0
+	for element in elements:
+		if element.get("type") == "count":
+			group_index += 1
+			continue
+		if group_index >= len(groups):
+			break
+		for index in groups[group_index][1]:
+			info_type, info_filters, _ = queries[index]
+			if not _matches(element, info_type, info_filters):
+				continue
+			info = element_info(lat, lon, element, info_type)
+			if info:
+				results[index].append(info)
+	return results
+
+def _post(query):
+	response = httpclient.post(OVERPASS_URL, data={"data": query}, timeout=OVERPASS_TIMEOUT)
+	response.raise_for_status()
+	return response.json()
+
+def get_union_infos(lat, lon, queries, area_id=None):
+	"""
+	Fetches every (info_type, info_filters, radius) query in one Overpass
+	request. Queries with radius 0 are looked up in `area_id` and return an
+	empty list when no area is given.
+	"""
+	query, groups = build_union_query(lat, lon, queries, area_id)
+	if not groups:
+		return [[] for _ in queries]
+	data = fetcher.with_retries(_post, query)
+	return split_elements(lat, lon, data.get("elements", []), queries, groups)
+
+def fetch_tiles(missing, cache):
+	"""
+	Fetches the missing (info_type, info_filter, tile) entries with one bbox
+	union over their envelope, then stores every entry of the envelope tiles
+	"""
+	pairs = sorted({(info_type, info_filter) for info_type, info_filter, _ in missing}, key=str)
+	filters = {}
+	for info_type, info_filter in pairs:
+		if info_filter is None or filters.get(info_type, []) is None:
+			filters[info_type] = None
+		else:
+			filters.setdefault(info_type, []).append(info_filter)
+	tiles = {tile for _, _, tile in missing}
+	south, west, north, east = tilecache.tiles_bounds(tiles)
+	lines = ["[out:json][timeout:25];", "("]
+	for info_type, info_filters in filters.items():
+		lines.append(f"nwr{tag_filter(info_type, info_filters)}({south},{west},{north},{east});")
+	lines += [");", "out center;"]
+	data = fetcher.with_retries(_post, "\n".join(lines))
+
+	envelope = [(x, y) for x in range(min(t[0] for t in tiles), max(t[0] for t in tiles) + 1)
+		for y in range(min(t[1] for t in tiles), max(t[1] for t in tiles) + 1)]
+	fetched = {tilecache.tile_key(info_type, info_filter, tile): [] for info_type, info_filter in pairs for tile in envelope}
+	for element in data.get("elements", []):
+		if "lat" in element and "lon" in element:
+			lat_info, lon_info = element["lat"], element["lon"]
+		elif "center" in element:
+			lat_info, lon_info = element["center"]["lat"], element["center"]["lon"]
+		else:
+			continue
+		tile = tilecache.tile_of(lat_info, lon_info)
+		for info_type, info_filter in pairs:
+			key = tilecache.tile_key(info_type, info_filter, tile)
+			if key in fetched and _matches(element, info_type, [info_filter] if info_filter else None):
+				fetched[key].append({
+					"name": element["tags"].get("name", "Inconnu"),
+					"value": element["tags"].get(info_type, "Autre"),
+					"lat": lat_info,
+					"lon": lon_info
+				})
+	cache.set_many(fetched)
+	return fetched
+
+def _tile_keys(lat, lon, query, needed):
+	# Cache keys covering one query, each also recorded in needed as (info_type, info_filter, tile)
+	info_type, info_filters, radius = query
+	keys = []
+	for info_filter in (list(info_filters) if info_filters else [None]):
+		for tile in tilecache.tiles_around(lat, lon, radius):
+			key = tilecache.tile_key(info_type, info_filter, tile)
+			needed[key] = (info_type, info_filter, tile)
+			keys.append(key)
+	return keys
+
+def prefetch(sites, queries):
+	"""
+	Loads every tile needed by the radius queries of all the (lat, lon)
+	sites in the tile cache, with at most one Overpass request over the
+	envelope of the missing tiles
+	"""
+	cache = tilecache.cache
+	if cache is None:
+		return
+	needed = {}
+	for lat, lon in sites:
+		for query in queries:
+			_tile_keys(lat, lon, query, needed)
+	cached = cache.get_many(needed)
+	missing = [entry for key, entry in needed.items() if key not in cached]
+	if missing:
+		fetch_tiles(missing, cache)
+
+def get_cached_infos(lat, lon, queries, cache):
+	"""
+	Answers (info_type, info_filters, radius) queries by filtering the cached
+	tiles covering each circle with haversine. Tiles missing from the cache
+	are fetched once for all queries.
+	"""
+	needed = {}
+	query_keys = [_tile_keys(lat, lon, query, needed) for query in queries]
+	elements_by_key = cache.get_many(needed)
+	missing = [entry for key, entry in needed.items() if key not in elements_by_key]
+	if missing:
+		elements_by_key.update(fetch_tiles(missing, cache))
+
+	results = []
+	for (_, _, radius), keys in zip(queries, query_keys):
+		infos = []
+		for key in keys:
+			for element in elements_by_key[key]:
+				distance = utils.haversine(lat, lon, element["lat"], element["lon"])
+				if distance <= radius:
+					infos.append({
+						"name": element["name"],
+						"type": element["value"],
+						"lat": element["lat"],
+						"lon": element["lon"],
+						"distance": distance
+					})
+		results.append(infos)
+	return results
+
+def get_infos(lat, lon, queries, area_id=None):
+	"""
+	Returns the infos of every (info_type, info_filters, radius) query, in
+	order. Radius queries go through the tile cache when it is enabled, the
+	others are sent as one union request.
+	"""
+	cache = tilecache.cache
+	cached_indexes = [i for i, query in enumerate(queries) if query[2] != 0] if cache else []
+	union_indexes = [i for i in range(len(queries)) if i not in cached_indexes]
+	results = [None] * len(queries)
+	if cached_indexes:
+		for index, infos in zip(cached_indexes, get_cached_infos(lat, lon, [queries[i] for i in cached_indexes], cache)):
+			results[index] = infos
+	if union_indexes:
+		for index, infos in zip(union_indexes, get_union_infos(lat, lon, [queries[i] for i in union_indexes], area_id)):
+			results[index] = infos
+	return results
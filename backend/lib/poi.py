@@ -0,0 +1,205 @@
+import json
+import os
+import threading
+import numpy as np
+import fetcher
+import names
+import overpass
+import spatial
+import tracing
+import ttlcache
+import utils
+
+POI_PROVIDER = os.environ.get("POI_PROVIDER", "overpass")
+POI_EXTRACT_PATH = os.environ.get("POI_EXTRACT_PATH", "./data/fixtures/poi_sample.geojson")
+GRID_CELL_DEGREES = 0.01
+AREA_CACHE_TTL = float(os.environ.get("AREA_CACHE_TTL", 24 * 3600))
+AREA_CACHE_SIZE = int(os.environ.get("AREA_CACHE_SIZE", 10000))
+
+# Area id of each city, and elements of each (area_id, info_type, info_filters) without their distances
+_area_ids = ttlcache.TTLCache(AREA_CACHE_SIZE, AREA_CACHE_TTL)
+area_cache = ttlcache.TTLCache(AREA_CACHE_SIZE, AREA_CACHE_TTL)
+_MISSING = object()
+
+class POIProvider:
+	"""
+	Source of the points of interest looked up by DataProvider. Queries are
+	(info_type, info_filters, radius) tuples and every method returns one
+	list of {name, type, lat, lon, distance} infos per query, in order.
+	"""
+
+	def get_infos_nearby(self, lat, lon, queries):
+		raise NotImplementedError
+
+	def get_infos_in_city_area(self, lat, lon, city, queries):
+		"""Infos located in the city boundaries, the radius of the queries is ignored"""
+		raise NotImplementedError
+
+	def prefetch_nearby(self, sites, queries):
+		"""Prepares the radius queries of several (lat, lon) sites at once, when the provider benefits from it"""
+		pass
+
+class OverpassProvider(POIProvider):
+	"""Live lookups against the public Overpass API"""
+
+	def get_infos_nearby(self, lat, lon, queries):
+		return overpass.get_infos(lat, lon, queries)
+
+	def prefetch_nearby(self, sites, queries):
+		overpass.prefetch(sites, queries)
+
+	def get_infos_in_city_area(self, lat, lon, city, queries):
+		"""
+		The area id and the elements of each query are cached per commune, so
+		later sites of the city only compute their distances
+		"""
+		if not queries:
+			return []
+		area_id = _area_ids.get(city, _MISSING)
+		if area_id is _MISSING:
+			with tracing.span("area_id"):
+				area_id = fetcher.with_retries(utils.get_area_id, city)
+			_area_ids.set(city, area_id)
+		keys = [(area_id, info_type, tuple(info_filters) if info_filters else None) for info_type, info_filters, _ in queries]
+		elements = [area_cache.get(key) for key in keys]
+		missing = [index for index, found in enumerate(elements) if found is None]
+		if missing:
+			fetched = overpass.get_infos(lat, lon, [(queries[index][0], queries[index][1], 0) for index in missing], area_id)
+			for index, infos in zip(missing, fetched):
+				elements[index] = [{key: value for key, value in info.items() if key != "distance"} for info in infos]
+				if area_id is not None:
+					area_cache.set(keys[index], elements[index])
+		return [[dict(info, distance=utils.haversine(lat, lon, info["lat"], info["lon"])) for info in infos] for infos in elements]
+
+def _feature_position(geometry):
+	# Points keep their position, other geometries use their bbox center like Overpass `out center`
+	if geometry["type"] == "Point":
+		return geometry["coordinates"][1], geometry["coordinates"][0]
+	coords = np.array(list(_iter_positions(geometry["coordinates"])), dtype=float)
+	return (coords[:, 1].min() + coords[:, 1].max()) / 2, (coords[:, 0].min() + coords[:, 0].max()) / 2
+
+def _iter_positions(coordinates):
+	if coordinates and isinstance(coordinates[0], (int, float)):
+		yield coordinates
+		return
+	for item in coordinates:
+		yield from _iter_positions(item)
+
+def _polygon_rings(geometry):
+	if geometry["type"] == "Polygon":
+		return [np.array(ring, dtype=float) for ring in geometry["coordinates"]]
+	if geometry["type"] == "MultiPolygon":
+		return [np.array(ring, dtype=float) for polygon in geometry["coordinates"] for ring in polygon]
+	return []
+
+def _points_in_rings(lats, lons, rings):
+	# Even-odd rule over every ring, holes and multipolygon parts included
+	inside = np.zeros(len(lats), dtype=bool)
+	for ring in rings:
+		x1, y1 = ring[:-1, 0], ring[:-1, 1]
+		x2, y2 = ring[1:, 0], ring[1:, 1]
+		for ax, ay, bx, by in zip(x1, y1, x2, y2):
+			crosses = (ay > lats) != (by > lats)
+			with np.errstate(divide='ignore', invalid='ignore'):
+				x_cross = ax + (lats - ay) * (bx - ax) / (by - ay)
+			inside ^= crosses & (lons < x_cross)
+	return inside
+
+class LocalProvider(POIProvider):
+	"""
+	Lookups in a regional OSM extract loaded in memory. The extract is a
+	GeoJSON FeatureCollection whose properties are the OSM tags, as written
+	by `osmium export extract.osm.pbf -o extract.geojson`. Positions are kept
+	in NumPy arrays indexed by a grid of GRID_CELL_DEGREES cells, and city
+	areas come from the administrative boundaries of the extract.
+	"""
+
+	def __init__(self, path=POI_EXTRACT_PATH):
+		with open(path, "r", encoding="utf-8") as f:
+			features = json.load(f)["features"]
+		points = [feature for feature in features if feature.get("geometry")]
+		self.tags = [feature.get("properties") or {} for feature in points]
+		positions = np.array([_feature_position(feature["geometry"]) for feature in points], dtype=float).reshape(-1, 2)
+		self.lats = positions[:, 0]
+		self.lons = positions[:, 1]
+		self.values = {}
+		self.grid = spatial.GridIndex(self.lats, self.lons, GRID_CELL_DEGREES)
+		self.boundaries = {}
+		self.city_indexes = {}
+		for feature in points:
+			properties = feature.get("properties") or {}
+			if properties.get("boundary") == "administrative" and properties.get("name"):
+				self.boundaries.setdefault(names.normalize(properties["name"]), _polygon_rings(feature["geometry"]))
+
+	def _tag_values(self, info_type):
+		if info_type not in self.values:
+			self.values[info_type] = np.array([tags.get(info_type) for tags in self.tags], dtype=object)
+		return self.values[info_type]
+
+	def _filter(self, indexes, info_type, info_filters):
+		values = self._tag_values(info_type)[indexes]
+		if info_filters:
+			mask = np.isin(values, list(info_filters))
+		else:
+			mask = values != None
+		return indexes[mask]
+
+	def _in_city(self, city):
+		# Indexes inside the city boundaries, computed once per city
+		key = names.normalize(city)
+		if key not in self.city_indexes:
+			rings = self.boundaries.get(key)
+			if not rings:
+				self.city_indexes[key] = np.array([], dtype=int)
+			else:
+				edges = np.concatenate(rings)
+				indexes = np.flatnonzero(
+					(self.lons >= edges[:, 0].min()) & (self.lons <= edges[:, 0].max()) &
+					(self.lats >= edges[:, 1].min()) & (self.lats <= edges[:, 1].max())
+				)
+				inside = _points_in_rings(self.lats[indexes], self.lons[indexes], rings)
+				self.city_indexes[key] = indexes[inside]
+		return self.city_indexes[key]
+
+	def _infos(self, indexes, info_type, distances):
+		return [{
+			"name": self.tags[index].get("name", "Inconnu"),
+			"type": self.tags[index].get(info_type, "Autre"),
+			"lat": float(self.lats[index]),
+			"lon": float(self.lons[index]),
+			"distance": float(distance)
+		} for index, distance in zip(indexes, distances)]
+
+	def get_infos_nearby(self, lat, lon, queries):
+		results = []
+		for info_type, info_filters, radius in queries:
+			indexes = self._filter(self.grid.candidates(lat, lon, radius), info_type, info_filters)
+			distances = self.grid.distances(lat, lon, indexes)
+			keep = distances <= radius
+			results.append(self._infos(indexes[keep], info_type, distances[keep]))
+		return results
+
+	def get_infos_in_city_area(self, lat, lon, city, queries):
+		inside = self._in_city(city)
+		results = []
+		for info_type, info_filters, _ in queries:
+			indexes = self._filter(inside, info_type, info_filters)
+			distances = self.grid.distances(lat, lon, indexes)
+			results.append(self._infos(indexes, info_type, distances))
+		return results
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_provider():
+	"""Process-wide provider selected by POI_PROVIDER (overpass or local)"""
+	global _provider
+	with _provider_lock:
+		if _provider is None:
+			if POI_PROVIDER == "local":
+				_provider = LocalProvider()
+			elif POI_PROVIDER == "overpass":
+				_provider = OverpassProvider()
+			else:
+				raise ValueError(f"Unknown POI provider: {POI_PROVIDER}")
+	return _provider
@@ -0,0 +1,99 @@
+import overpass
+
+# (info_type, info_filters, info_explicit, radius name) of the queries made for every site
+QUERY_TEMPLATE = [
+	("amenity", ("restaurant", "fast_food", "cafe", "bar", "pub"), "Shop", "shop"),
+	("shop", ("clothes", "shoes", "jewelry", "electronics", "mobile_phone",
+	  "convenience", "bakery", "butcher", "deli", "greengrocer",
+	  "books", "gift", "hairdresser", "beauty", "optician",
+	  "sports", "toys"), "Shop", "shop"),
+	("shop", ("supermarket",), "Food Store", "food_store"),
+	("amenity", ("hospital",), "Hospital", "hospital"),
+	("amenity", ("clinic", "doctors"), "Healthcare", "healthcare"),
+	("amenity", ("police", "fire_station"), "Public_Services", "public_services"),
+	("amenity", ("school",), "School", "school"),
+	("highway", ("bus_stop",), "Transport", "transport"),
+	("station", ("subway",), "Transport", "transport"),
+	("railway", ("tram_stop",), "Transport", "transport"),
+	("railway", ("station",), "Train_Station", "transport"),
+]
+
+# Radius of each query by city type, 0 is the whole city area.
+# school_charge lists the radius tried in order until schools are found,
+# an empty list meaning the schools of the city.
+PROFILES = {
+	"Metropolis": {
+		"radius": {
+			"shop": 500, "transport": 500, "food_store": 300, "hospital": 2000,
+			"healthcare": 1000, "public_services": 2000, "school": 500,
+		},
+		"school_charge": [500],
+	},
+	"Large_City": {
+		"radius": {
+			"shop": 1000, "transport": 1000, "food_store": 500, "hospital": 2000,
+			"healthcare": 2000, "public_services": 3000, "school": 1000,
+		},
+		"school_charge": [1000],
+	},
+	"Mid-sized_City": {
+		"radius": {
+			"shop": 2000, "transport": 2000, "food_store": 0, "hospital": 0,
+			"healthcare": 0, "public_services": 5000, "school": 0,
+		},
+		"school_charge": [],
+	},
+	"Little_City": {
+		"radius": {
+			"shop": 3000, "transport": 3000, "food_store": 2000, "hospital": 5000,
+			"healthcare": 5000, "public_services": 5000, "school": 3000,
+		},
+		"school_charge": [1500, 3000],
+	},
+	"Village": {
+		"radius": {
+			"shop": 5000, "transport": 5000, "food_store": 5000, "hospital": 10000,
+			"healthcare": 10000, "public_services": 10000, "school": 5000,
+		},
+		"school_charge": [5000],
+	},
+}
+
+class CityProfile:
+	"""
+	Query plan of a city type: its (info_type, info_filters, info_explicit,
+	radius) queries, split into radius and city area provider queries, and
+	its school charge strategy
+	"""
+
+	def __init__(self, city_type, radius, school_charge):
+		self.city_type = city_type
+		self.shop_radius = radius["shop"]
+		self.transport_radius = radius["transport"]
+		self.queries = tuple(
+			(info_type, info_filters, info_explicit, radius[name])
+			for info_type, info_filters, info_explicit, name in QUERY_TEMPLATE
+		)
+		self.radius_queries = tuple(
+			(info_type, info_filters, radius) for info_type, info_filters, _, radius in self.queries if radius != 0
+		)
+		self.area_queries = tuple(
+			(info_type, info_filters, 0) for info_type, info_filters, _, radius in self.queries if radius == 0
+		)
+		self.school_charge_radius = tuple(school_charge)
+		# Merged Overpass groups are built once here and reused by every request of the profile
+		overpass.compile_groups(self.radius_queries, False)
+		overpass.compile_groups(self.area_queries, True)
+
+	def merge_infos(self, radius_infos, area_infos):
+		"""Puts the infos of radius_queries and area_queries back in the order of queries"""
+		radius_infos, area_infos = iter(radius_infos), iter(area_infos)
+		return [next(area_infos) if radius == 0 else next(radius_infos) for _, _, _, radius in self.queries]
+
+_profiles = {city_type: CityProfile(city_type, **profile) for city_type, profile in PROFILES.items()}
+
+def get_profile(city_type):
+	profile = _profiles.get(city_type)
+	if profile is None:
+		raise ValueError(f"Unknown city type: {city_type}")
+	return profile
@@ -0,0 +1,76 @@
+import sqlite3
+import threading
+import time
+import communedb
+import poi
+import school
+import logs
+
+logger = logs.get_logger("readiness")
+
+_ready = threading.Event()
+_lock = threading.Lock()
+_datasets = {}
+
+def _communes():
+	version = communedb.current_version()
+	if version is None:
+		raise ValueError("no snapshot, run python manage.py ingest")
+	return {"version": version}
+
+def _schools():
+	source = school.school_source(school.SCHOOL_CSV_PATH)
+	table = school.load_schools(source)
+	if table is None:
+		raise ValueError(f"unreadable schools table {source}")
+	school.load_school_charges(source)
+	if "lat_school" in table.columns:
+		school.load_school_index(source)
+	return {"source": source}
+
+def _poi():
+	return {"provider": type(poi.get_provider()).__name__}
+
+# Reference data loaded before the first request, in order
+PRELOADS = (
+	("communes", _communes),
+	("schools", _schools),
+	("poi", _poi),
+)
+
+def preload():
+	"""
+	Loads the reference data indexes once for the process. Under gunicorn
+	with preload_app, this runs in the master before the workers are forked,
+	so that they share these pages copy-on-write instead of each loading
+	its own copy. A dataset that fails to load is reported, the lookups
+	using it then degrade as they do without it.
+	"""
+	with _lock:
+		if _ready.is_set():
+			return
+		for name, load in PRELOADS:
+			start = time.perf_counter()
+			try:
+				_datasets[name] = {"status": "loaded", **load()}
+			except Exception as e:
+				_datasets[name] = {"status": "unavailable", "error": str(e)}
+				logger.warning("Données de référence %s non chargées: %s", name, e)
+			_datasets[name]["seconds"] = round(time.perf_counter() - start, 3)
+		# SQLite connections must not be shared with the forked workers, they open their own
+		communedb.close()
+		_ready.set()
+		logger.info("Données de référence chargées", extra={"fields": {"datasets": _datasets}})
+
+def is_preloaded():
+	return _ready.is_set()
+
+def snapshot_version():
+	"""Version of the current snapshot of the communes database, None when there is none"""
+	try:
+		return communedb.current_version()
+	except sqlite3.Error:
+		return None
+
+def datasets():
+	return {name: dict(status) for name, status in _datasets.items()}
@@ -0,0 +1,157 @@
+import functools
+import json
+import os
+import re
+import threading
+import numpy as np
+
+_lock = threading.RLock()
+_datasets = {}
+
+def dataset(loader):
+	"""
+	Caches what a loader returns for the lifetime of the process, so every
+	reference CSV is parsed and indexed once whatever the number of lookups
+	"""
+	@functools.wraps(loader)
+	def load(*args):
+		key = (loader.__name__,) + args
+		with _lock:
+			if key not in _datasets:
+				_datasets[key] = loader(*args)
+			return _datasets[key]
+	return load
+
+def retain(source, *loaders):
+	"""Drops what the loaders returned for any other source than `source`, a snapshot that is no longer current"""
+	names = {loader.__name__ for loader in loaders}
+	with _lock:
+		for key in [key for key in _datasets if key[0] in names and key[1:2] != (source,)]:
+			del _datasets[key]
+
+def extract_ville_name(commune):
+	match = re.match(r"(.+?)\s+\d{5}$", commune)
+	return match.group(1).strip() if match else commune
+
+def extract_code_postal(commune):
+	match = re.search(r"\s(\d{5})$", commune)
+	return match.group(1) if match else None
+
+class NameIndex:
+	"""
+	Positions of normalized names, for exact lookups and for the substring
+	fallback through a trigram index. Positions are returned in file order.
+	"""
+
+	def __init__(self, names):
+		self.names = names
+		self.exact = {}
+		self.trigrams = {}
+		for position, name in enumerate(names):
+			self.exact.setdefault(name, []).append(position)
+			for i in range(len(name) - 2):
+				self.trigrams.setdefault(name[i:i + 3], set()).add(position)
+
+	def find(self, name):
+		return self.exact.get(name, [])
+
+	def contains(self, fragment):
+		if len(fragment) < 3:
+			return [position for position, name in enumerate(self.names) if fragment in name]
+		candidates = None
+		for i in range(len(fragment) - 2):
+			positions = self.trigrams.get(fragment[i:i + 3])
+			if not positions:
+				return []
+			candidates = positions if candidates is None else candidates & positions
+		return sorted(position for position in candidates if fragment in self.names[position])
+
+class LookupTable:
+	"""
+	Rows of a reference table kept as column arrays, the key column being
+	interned: `keys` holds every distinct key once, `key_ids` the key of
+	each row, and the names are normalized and indexed once per key.
+	match() returns the row positions, in file order, of the first lookup
+	that finds something: exact name, then exact short name (without the
+	trailing postal code), then substring. Given the postal code, the rows
+	of that code and name are looked up first in a map built at load.
+	"""
+
+	def __init__(self, key_column, keys, key_ids, columns, normalize, with_short_name=True):
+		self.key_column = key_column
+		self.keys = list(keys)
+		self.key_ids = key_ids
+		self.columns = columns
+		# Row positions of each key, in file order
+		order = np.argsort(key_ids, kind="stable")
+		self.key_positions = np.split(order, np.cumsum(np.bincount(key_ids, minlength=len(self.keys)))[:-1])
+		self.names = NameIndex([normalize(key) for key in self.keys])
+		self.short_names = NameIndex([normalize(extract_ville_name(key)) for key in self.keys]) if with_short_name else None
+		self.codes = {}
+		if with_short_name:
+			for key_id, key in enumerate(self.keys):
+				code = extract_code_postal(key)
+				if code:
+					self.codes.setdefault((code, self.short_names.names[key_id]), []).append(key_id)
+
+	@classmethod
+	def from_frame(cls, df, key_column, normalize, with_short_name=True):
+		keys, key_ids = intern(df[key_column].to_numpy())
+		columns = {column: df[column].to_numpy() for column in df.columns if column != key_column}
+		return cls(key_column, keys, key_ids, columns, normalize, with_short_name)
+
+	@classmethod
+	def from_snapshot(cls, directory, table, normalize, with_short_name=True):
+		"""Table written by save_table, its arrays memory-mapped read-only"""
+		with open(os.path.join(directory, f"{table}.json"), "r", encoding="utf-8") as f:
+			manifest = json.load(f)
+		load = lambda name: np.load(os.path.join(directory, f"{table}.{name}.npy"), mmap_mode="r")
+		columns = {column: load(column) for column in manifest["columns"]}
+		return cls(manifest["key_column"], load("keys").tolist(), load("key_ids"), columns, normalize, with_short_name)
+
+	def positions(self, key_ids):
+		"""Row positions of the given keys, in file order"""
+		if not key_ids:
+			return []
+		if len(key_ids) == 1:
+			return self.key_positions[key_ids[0]].tolist()
+		return np.sort(np.concatenate([self.key_positions[key_id] for key_id in key_ids])).tolist()
+
+	def match(self, name_norm, code_postal=None):
+		key_ids = self.codes.get((code_postal, name_norm), []) if code_postal else []
+		if not key_ids:
+			key_ids = self.names.find(name_norm)
+		if not key_ids and self.short_names:
+			key_ids = self.short_names.find(name_norm)
+		if not key_ids:
+			key_ids = self.names.contains(name_norm)
+		return self.positions(key_ids)
+
+	def row(self, position):
+		row = {self.key_column: self.keys[self.key_ids[position]]}
+		for column, values in self.columns.items():
+			row[column] = values[position]
+		return row
+
+	def first(self, name_norm, code_postal=None):
+		positions = self.match(name_norm, code_postal)
+		return self.row(positions[0]) if positions else None
+
+def intern(values):
+	"""(distinct strings, index of each value in them) of a string column"""
+	keys, key_ids = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+	return keys, key_ids.astype(np.int32)
+
+def save_table(directory, table, key_column, keys, key_ids, columns):
+	"""
+	Writes a table as one .npy file per column plus the interned keys, for
+	LookupTable.from_snapshot. Every process mapping these files shares a
+	single copy of them through the page cache.
+	"""
+	os.makedirs(directory, exist_ok=True)
+	np.save(os.path.join(directory, f"{table}.keys.npy"), np.asarray(keys, dtype=str))
+	np.save(os.path.join(directory, f"{table}.key_ids.npy"), np.asarray(key_ids, dtype=np.int32))
+	for column, values in columns.items():
+		np.save(os.path.join(directory, f"{table}.{column}.npy"), np.ascontiguousarray(values))
+	with open(os.path.join(directory, f"{table}.json"), "w", encoding="utf-8") as f:
+		json.dump({"key_column": key_column, "columns": list(columns)}, f)
@@ -0,0 +1,88 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+RESUME_CACHE_PATH = os.environ.get("RESUME_CACHE_PATH", "./data/resumes.sqlite3")
+RESUME_CACHE_TTL = float(os.environ.get("RESUME_CACHE_TTL", 30 * 24 * 3600))
+RESUME_CACHE_MAX_ENTRIES = int(os.environ.get("RESUME_CACHE_MAX_ENTRIES", 10000))
+
+def normalize_text(text):
+	"""Same text for descriptions that only differ by unicode form or whitespace"""
+	text = unicodedata.normalize("NFC", text)
+	lines = [re.sub(r"[ \t]+", " ", line).strip() for line in text.splitlines()]
+	return "\n".join(line for line in lines if line)
+
+def resume_key(model, prompt_version, text):
+	return hashlib.sha256(f"{model}\n{prompt_version}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+class ResumeCache:
+	"""
+	SQLite store of the generated résumés keyed by resume_key, or of the
+	descriptions waiting for theirs in another table, with a time to
+	live and a least recently used eviction above max_entries. The file is
+	shared by every worker process.
+	"""
+
+	def __init__(self, path=RESUME_CACHE_PATH, ttl=RESUME_CACHE_TTL, max_entries=RESUME_CACHE_MAX_ENTRIES, table="resumes"):
+		self.path = path
+		self.table = table
+		self.ttl = ttl
+		self.max_entries = max_entries
+		self.hits = 0
+		self.misses = 0
+		self._lock = threading.Lock()
+		self._local = threading.local()
+
+	def _connection(self):
+		conn = getattr(self._local, "conn", None)
+		if conn is None:
+			conn = sqlite3.connect(self.path, timeout=10)
+			conn.execute("PRAGMA journal_mode=WAL")
+			conn.execute(f'CREATE TABLE IF NOT EXISTS "{self.table}" ("key" TEXT PRIMARY KEY, "resume" TEXT NOT NULL, "created_at" REAL NOT NULL, "accessed_at" REAL NOT NULL)')
+			conn.execute(f'CREATE INDEX IF NOT EXISTS "{self.table}_accessed_at" ON "{self.table}" ("accessed_at")')
+			self._local.conn = conn
+		return conn
+
+	def get(self, key):
+		"""Fresh cached résumé of the key, else None"""
+		now = time.time()
+		conn = self._connection()
+		row = conn.execute(f'SELECT "resume" FROM "{self.table}" WHERE "key" = ? AND "created_at" >= ?', (key, now - self.ttl)).fetchone()
+		if row is not None:
+			with conn:
+				conn.execute(f'UPDATE "{self.table}" SET "accessed_at" = ? WHERE "key" = ?', (now, key))
+		with self._lock:
+			if row is None:
+				self.misses += 1
+			else:
+				self.hits += 1
+		return row[0] if row is not None else None
+
+	def set(self, key, resume):
+		"""Stores the résumé then evicts expired and least recently used rows"""
+		now = time.time()
+		conn = self._connection()
+		with conn:
+			conn.execute(f'INSERT OR REPLACE INTO "{self.table}" ("key", "resume", "created_at", "accessed_at") VALUES (?, ?, ?, ?)', (key, resume, now, now))
+			conn.execute(f'DELETE FROM "{self.table}" WHERE "created_at" < ?', (now - self.ttl,))
+			excess = conn.execute(f'SELECT COUNT(*) FROM "{self.table}"').fetchone()[0] - self.max_entries
+			if excess > 0:
+				conn.execute(f'DELETE FROM "{self.table}" WHERE "key" IN (SELECT "key" FROM "{self.table}" ORDER BY "accessed_at" LIMIT ?)', (excess,))
+
+	def stats(self):
+		with self._lock:
+			hits, misses = self.hits, self.misses
+		total = hits + misses
+		return {
+			"hits": hits,
+			"misses": misses,
+			"hit_ratio": round(hits / total, 3) if total else 0,
+			"entries": self._connection().execute(f'SELECT COUNT(*) FROM "{self.table}"').fetchone()[0],
+		}
+
+# Process-wide cache, disabled with RESUME_CACHE_PATH=""
+cache = ResumeCache() if RESUME_CACHE_PATH else None
@@ -1,48 +1,81 @@
+import logging
+import os
+import numpy as np
 import pandas as pd
-import re
-import unicodedata
-from collections import Counter
+import communedb
+import names
+import refdata
+import spatial
 import utils
+import logs
 
 CAPACITE_MAX_PAR_CLASSE = 30
+SCHOOL_CSV_PATH = "./data/raw/School.csv"
 
-def normalize(text):
-	if not isinstance(text, str):
-		text = str(text)
-	text = text.lower()
-	text = unicodedata.normalize('NFKD', text).encode('ASCII', 'ignore').decode('utf-8')
-	return text
+logger = logs.get_logger("school")
 
-def get_schools_density_by_radius(lat, lon, radius, csv_path="./data/raw/School.csv"):
-	try:
-		df = pd.read_csv(csv_path, sep=";", encoding="utf-8")
+_current_source = None
 
-		required_columns = ['Commune', 'total_stud', 'nbr_stud_actual', 'nbr_classe', 'lat_school', 'lon_school']
-		if not all(col in df.columns for col in required_columns):
-			print(f"Erreur: Les colonnes attendues ne sont pas présentes dans le fichier CSV")
-			print(f"Colonnes requises: {required_columns}")
-			print(f"Colonnes trouvées: {df.columns.tolist()}")
-			return None
+def school_source(csv_path):
+	"""
+	Directory of the schools of the current snapshot written by
+	`manage.py ingest` when there is one, else csv_path
+	"""
+	global _current_source
+	source = communedb.snapshot_directory() or csv_path
+	if source != _current_source:
+		# The tables and indexes of the previous snapshot are freed once its last lookups are done
+		refdata.retain(source, load_schools, load_school_index, load_school_charges)
+		_current_source = source
+	return source
+
+@refdata.dataset
+def load_schools(source):
+	if os.path.isdir(source):
+		# Memory-mapped columns, shared by every worker process
+		return refdata.LookupTable.from_snapshot(source, "schools", names.normalize)
+
+	df = pd.read_csv(source, sep=";", encoding="utf-8")
+
+	required_columns = ['Commune', 'total_stud', 'nbr_stud_actual', 'nbr_classe']
+	if not all(col in df.columns for col in required_columns):
+		logger.error("Colonnes attendues absentes du fichier CSV des écoles", extra={"fields": {
+			"csv_path": source, "required_columns": required_columns, "columns": df.columns.tolist(),
+		}})
+		return None
 
-		df['Commune'] = df['Commune'].str.strip()
-		df['total_stud'] = df['total_stud'].astype(str).str.replace(" ", "").astype(int)
-		df['nbr_stud_actual'] = df['nbr_stud_actual'].astype(str).str.replace(" ", "").astype(int)
-		df['nbr_classe'] = df['nbr_classe'].astype(str).str.replace(" ", "").astype(int)
+	df['Commune'] = df['Commune'].str.strip()
+	df['total_stud'] = df['total_stud'].astype(str).str.replace(" ", "").astype(int)
+	df['nbr_stud_actual'] = df['nbr_stud_actual'].astype(str).str.replace(" ", "").astype(int)
+	df['nbr_classe'] = df['nbr_classe'].astype(str).str.replace(" ", "").astype(int)
+	if 'lat_school' in df.columns and 'lon_school' in df.columns:
 		df['lat_school'] = df['lat_school'].astype(float)
 		df['lon_school'] = df['lon_school'].astype(float)
+	return refdata.LookupTable.from_frame(df, 'Commune', names.normalize)
 
-		df['distance'] = df.apply(
-			lambda row: utils.haversine(lat, lon, row['lat_school'], row['lon_school']),
-			axis=1
-		)
+@refdata.dataset
+def load_school_index(source):
+	columns = load_schools(source).columns
+	return spatial.GridIndex(columns['lat_school'], columns['lon_school'])
 
-		match = df[df['distance'] <= radius]
+def get_schools_density_by_radius(lat, lon, radius, csv_path=SCHOOL_CSV_PATH):
+	try:
+		source = school_source(csv_path)
+		table = load_schools(source)
 
-		match = match.sort_values(by='distance')
+		if table is None or 'lat_school' not in table.columns or 'lon_school' not in table.columns:
+			logger.error(
+				"Colonnes de coordonnées absentes du fichier CSV des écoles", extra={"fields": {"csv_path": source}}
+			)
+			return None
 
-		if not match.empty:
+		indexes, distances = load_school_index(source).within(lat, lon, radius)
+		order = np.argsort(distances)
+
+		if len(order):
 			results = []
-			for i, row in match.iterrows():
+			for position in order:
+				row = table.row(indexes[position])
 				school = {
 					'commune': str(row['Commune']),
 					'total_stud': int(row['total_stud']),
@@ -50,154 +83,153 @@ def get_schools_density_by_radius(lat, lon, radius, csv_path="./data/raw/School.
 					'nbr_stud_actual': int(row['nbr_stud_actual']),
 					'lat': float(row['lat_school']),
 					'lon': float(row['lon_school']),
-					'distance': float(row['distance'])
+					'distance': float(distances[position])
 				}
 				results.append(school)
 			return results
 		else:
-			print(f"Aucune école trouvée dans un rayon de {radius} mètres")
+			logger.debug("Aucune école trouvée dans un rayon de %s mètres", radius)
 			return None
 	except Exception as e:
-		print(f"Erreur lors de la recherche des écoles par rayon: {e}")
-		import traceback
-		traceback.print_exc()
+		# The traceback is only worth its size when debugging
+		logger.warning(
+			"Erreur lors de la recherche des écoles par rayon: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG)
+		)
 		return None
 
-def get_school_density(nom_ville, csv_path="./data/raw/School.csv"):
+def get_school_density(nom_ville, csv_path=SCHOOL_CSV_PATH, code_postal=None):
 	try:
-		nom_ville_norm = normalize(nom_ville)
-		df = pd.read_csv(csv_path, sep=";", encoding="utf-8")
+		nom_ville_norm = names.normalize(nom_ville)
+		table = load_schools(school_source(csv_path))
 
-		required_columns = ['Commune', 'total_stud', 'nbr_stud_actual', 'nbr_classe']
-		if not all(col in df.columns for col in required_columns):
-			print(f"Erreur: Les colonnes attendues ne sont pas présentes dans le fichier CSV")
+		if table is None:
 			return None
 
-		df['Commune'] = df['Commune'].str.strip()
-		df['total_stud'] = df['total_stud'].astype(str).str.replace(" ", "").astype(int)
-		df['nbr_stud_actual'] = df['nbr_stud_actual'].astype(str).str.replace(" ", "").astype(int)
-		df['nbr_classe'] = df['nbr_classe'].astype(str).str.replace(" ", "").astype(int)
-		df['Commune_norm'] = df['Commune'].apply(normalize)
+		results = []
+		for position in table.match(nom_ville_norm, code_postal) :
+			row = table.row(position)
+			school = {
+				'commune': str(row['Commune']),
+				'total_stud': int(row['total_stud']),
+				'nbr_classe': int(row['nbr_classe']),
+				'nbr_stud_actual': int(row['nbr_stud_actual'])
+			}
+			results.append(school)
+		if results :
+			return results
+		else:
+			return None
+	except Exception as e:
+		logger.warning(
+			"Erreur lors de la recherche des données capacite ecole: %s", e,
+			exc_info=logger.isEnabledFor(logging.DEBUG),
+		)
+		return None
 
-		def extract_ville_name(commune):
-			match = re.match(r"(.+?)\s+\d{5}$", commune)
-			return match.group(1).strip() if match else commune
+# Labels of the occupancy statuses, English in radius mode and French in city mode
+STATUS_LABELS = {
+	"en": ("Exceeding Capacity", "High Occupancy", "Optimal", "Normal", "Under Capacity", "Severely Underutilized"),
+	"fr": ("Surcharge", "Proche surcharge", "Optimal", "Normal", "Sous-utilisation", "Très faible"),
+}
 
-		df['Commune_short'] = df['Commune'].apply(extract_ville_name)
-		df['Commune_short_norm'] = df['Commune_short'].apply(normalize)
+def occupancy_status(total_stud, nbr_classe):
+	"""
+	Index in STATUS_LABELS of the occupancy status of every school, from its
+	students and its theoretical capacity of CAPACITE_MAX_PAR_CLASSE per class
+	"""
+	capacite_theorique_max = nbr_classe * CAPACITE_MAX_PAR_CLASSE
+	taux = np.divide(
+		total_stud, capacite_theorique_max, out=np.zeros(len(total_stud)), where=capacite_theorique_max != 0
+	) * 100
+	return np.select([taux > 100, taux >= 95, taux >= 80, taux >= 60, taux >= 40], [0, 1, 2, 3, 4], 5)
 
-		match = df[df['Commune_norm'] == nom_ville_norm]
+class SchoolCharges:
+	"""
+	Occupancy status of every school, computed once at load, and the status
+	histograms of every commune key of the lookup table
+	"""
 
-		if match.empty:
-			match = df[df['Commune_short_norm'] == nom_ville_norm]
+	def __init__(self, table):
+		self.table = table
+		self.status = occupancy_status(table.columns['total_stud'], table.columns['nbr_classe'])
+		self.by_code = {key: self.histogram(table.positions(key_ids)) for key, key_ids in table.codes.items()}
+		self.by_name = {name: self.histogram(table.positions(key_ids)) for name, key_ids in table.names.exact.items()}
+		self.by_short_name = {
+			name: self.histogram(table.positions(key_ids)) for name, key_ids in table.short_names.exact.items()
+		} if table.short_names else {}
 
-		if match.empty:
-			match = df[df['Commune_norm'].str.contains(nom_ville_norm)]
+	def histogram(self, positions):
+		"""(count of each status, statuses in order of first appearance) of the schools at positions, in order"""
+		statuses = self.status[np.asarray(positions, dtype=int)]
+		counts = np.bincount(statuses, minlength=len(STATUS_LABELS["en"]))
+		_, first = np.unique(statuses, return_index=True)
+		return counts, statuses[np.sort(first)]
 
-		if not match.empty:
-			results = []
-			i = 0
-			for i, row in match.iterrows() :
-				school = {
-					'commune': str(row['Commune']),
-					'total_stud': int(row['total_stud']),
-					'nbr_classe': int(row['nbr_classe']),
-					'nbr_stud_actual': int(row['nbr_stud_actual'])
-				}
-				results.append(school)
-				i += 1
-		if results :
-			return results
-		else:
-			return None
-	except Exception as e:
-		print(f"Erreur lors de la recherche des données capacite ecole': {e}")
+	def city(self, name_norm, code_postal=None):
+		# Same lookup order as refdata.LookupTable.match
+		histogram = self.by_code.get((code_postal, name_norm)) if code_postal else None
+		if histogram is None:
+			histogram = self.by_name.get(name_norm)
+		if histogram is None:
+			histogram = self.by_short_name.get(name_norm)
+		if histogram is None:
+			histogram = self.histogram(self.table.positions(self.table.names.contains(name_norm)))
+		return histogram
+
+@refdata.dataset
+def load_school_charges(source):
+	table = load_schools(source)
+	return SchoolCharges(table) if table is not None else None
+
+def status_summary(histogram, labels):
+	counts, statuses = histogram
+	total = int(counts.sum())
+	if total == 0:
 		return None
+	# Ties go to the status seen first, as with Counter.most_common
+	most_common = max(statuses, key=lambda status: counts[status])
+	most_common_count = int(counts[most_common])
+	percentage = (most_common_count / total) * 100
+	return {
+		"Total_of_Elementary_School": total,
+		"Status_Recap": {labels[status]: int(counts[status]) for status in statuses},
+		"Most_common_status": labels[most_common],
+		"Most_common_count": most_common_count,
+		"Most_common_occurence": str(round(percentage)) + "%"
+	}
 
-def school_charge_radius(lat, lon, radius) :
-	stats = get_schools_density_by_radius(lat, lon, radius)
-	global_statut = []
-	if stats:
-		for school in stats:
-			capacite_theorique_max = school['nbr_classe'] * CAPACITE_MAX_PAR_CLASSE
-			if capacite_theorique_max == 0:
-				taux = 0
-			else:
-				taux = (school['total_stud'] / capacite_theorique_max) * 100
-
-			if taux > 100:
-				statut = "Exceeding Capacity"
-			elif taux >= 95:
-				statut = "High Occupancy"
-			elif taux >= 80:
-				statut = "Optimal"
-			elif taux >= 60:
-				statut = "Normal"
-			elif taux >= 40:
-				statut = "Under Capacity"
-			else:
-				statut = "Severely Underutilized"
-			global_statut.append(statut)
-		status_count = Counter(global_statut)
-		most_common_status = status_count.most_common(1)[0][0]
-		most_common_count = status_count.most_common(1)[0][1]
-		if len(global_statut) == 0:
-			percentage = 0
-		else:
-			percentage = (most_common_count / len(global_statut)) * 100
-
-		status_summary = {
-			"Total_of_Elementary_School": len(stats),
-			"Status_Recap": dict(status_count),
-			"Most_common_status": most_common_status,
-			"Most_common_count": most_common_count,
-			"Most_common_occurence": str(round(percentage)) + "%"
-		}
-		return status_summary
-	else:
+def school_charge_radius(lat, lon, radius, csv_path=SCHOOL_CSV_PATH) :
+	try:
+		source = school_source(csv_path)
+		charges = load_school_charges(source)
+		if charges is None or 'lat_school' not in charges.table.columns or 'lon_school' not in charges.table.columns:
+			logger.error(
+				"Colonnes de coordonnées absentes du fichier CSV des écoles", extra={"fields": {"csv_path": source}}
+			)
+			return None
+		indexes, distances = load_school_index(source).within(lat, lon, radius)
+		if not len(indexes):
+			logger.debug("Aucune école trouvée dans un rayon de %s mètres", radius)
+			return None
+		# Closest schools first, so that ties keep the status of the closest one
+		return status_summary(charges.histogram(indexes[np.argsort(distances)]), STATUS_LABELS["en"])
+	except Exception as e:
+		logger.warning(
+			"Erreur lors de la recherche des écoles par rayon: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG)
+		)
 		return None
 
-def school_charge_city(city) :
-	stats = get_school_density(city)
-	global_statut = []
-	if stats:
-		for school in stats:
-			capacite_theorique_max = school['nbr_classe'] * CAPACITE_MAX_PAR_CLASSE
-			if capacite_theorique_max == 0:
-				taux = 0
-			else:
-				taux = (school['total_stud'] / capacite_theorique_max) * 100
-
-			if taux > 100:
-				statut = "Surcharge"
-			elif taux >= 95:
-				statut = "Proche surcharge"
-			elif taux >= 80:
-				statut = "Optimal"
-			elif taux >= 60:
-				statut = "Normal"
-			elif taux >= 40:
-				statut = "Sous-utilisation"
-			else:
-				statut = "Très faible"
-			global_statut.append(statut)
-		status_count = Counter(global_statut)
-		most_common_status = status_count.most_common(1)[0][0]
-		most_common_count = status_count.most_common(1)[0][1]
-		if len(global_statut) == 0:
-			percentage = 0
-		else:
-			percentage = (most_common_count / len(global_statut)) * 100
-
-		status_summary = {
-			"Total_of_Elementary_School": len(stats),
-			"Status_Recap": dict(status_count),
-			"Most_common_status": most_common_status,
-			"Most_common_count": most_common_count,
-			"Most_common_occurence": str(round(percentage)) + "%"
-		}
-		return status_summary
-	else:
+def school_charge_city(city, code_postal=None, csv_path=SCHOOL_CSV_PATH) :
+	try:
+		charges = load_school_charges(school_source(csv_path))
+		if charges is None:
+			return None
+		return status_summary(charges.city(names.normalize(city), code_postal), STATUS_LABELS["fr"])
+	except Exception as e:
+		logger.warning(
+			"Erreur lors de la recherche des données capacite ecole: %s", e,
+			exc_info=logger.isEnabledFor(logging.DEBUG),
+		)
 		return None
 
 # if __name__ == "__main__":
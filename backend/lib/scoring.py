@@ -0,0 +1,333 @@
+import numpy as np
+import pandas as pd
+
+# Vectorized version of Score.calculate_cost_score over a table of site stats,
+# one row per site. Results are identical to the scalar functions, the
+# per city_type thresholds of Score.py being rows of THRESHOLDS.
+
+WEIGHTS = {
+	"Travail": 0.25,
+	"Transport": 0.22,
+	"Service public": 0.13,
+	"Éducation": 0.12,
+	"Commerce": 0.20,
+	"Santé": 0.08,
+}
+
+INF = float("inf")
+
+# "default" holds the thresholds of the else branches of Score.py
+THRESHOLDS = pd.DataFrame.from_dict({
+	"Metropolis": {
+		"tolerant_unemployment": 1, "job_ratio_factor": 6,
+		"expected_transport": 12, "max_transport_distance": 700, "transport_bonus_threshold": 25,
+		"train_bonus_max": 20, "train_bonus_per_station": 6,
+		"expected_services": 10, "max_services_distance": 2400, "services_excellence_threshold": 15,
+		"expected_schools": 6, "max_schools_distance": 700, "schools_bonus_threshold": 10,
+		"expected_shops": 30, "max_shop_distance": 800, "expected_food_stores": 2,
+		"max_food_distance": 1200, "shops_excellence_threshold": 200,
+		"expected_healthcare": 8, "max_healthcare_distance": 1000, "expected_hospital": 1.5,
+		"max_hospital_distance": 2500, "hospital_bonus_threshold": 5,
+		"excellence_transport": 40, "excellence_shop": 500, "excellence_healthcare": 25,
+		"excellence_hospital": 8, "excellence_services": 15,
+		"excellence_bonus_1": 2, "excellence_bonus_2": 4, "excellence_bonus_3": 7, "excellence_bonus_4": 10,
+	},
+	"Large_City": {
+		"tolerant_unemployment": 0, "job_ratio_factor": 8,
+		"expected_transport": 12, "max_transport_distance": 800, "transport_bonus_threshold": 25,
+		"train_bonus_max": 15, "train_bonus_per_station": 7,
+		"expected_services": 5, "max_services_distance": 2800, "services_excellence_threshold": 10,
+		"expected_schools": 5, "max_schools_distance": 1100, "schools_bonus_threshold": INF,
+		"expected_shops": 25, "max_shop_distance": 1200, "expected_food_stores": 1.5,
+		"max_food_distance": 1800, "shops_excellence_threshold": 80,
+		"expected_healthcare": 4, "max_healthcare_distance": 1500, "expected_hospital": 0.8,
+		"max_hospital_distance": 4000, "hospital_bonus_threshold": INF,
+		"excellence_transport": 25, "excellence_shop": 200, "excellence_healthcare": 15,
+		"excellence_hospital": 3, "excellence_services": 8,
+		"excellence_bonus_1": 1, "excellence_bonus_2": 3, "excellence_bonus_3": 5, "excellence_bonus_4": 5,
+	},
+	"Mid-sized_City": {
+		"tolerant_unemployment": 0, "job_ratio_factor": 12,
+		"expected_transport": 8, "max_transport_distance": 1200, "transport_bonus_threshold": 15,
+		"train_bonus_max": 12, "train_bonus_per_station": 10,
+		"expected_services": 3.5, "max_services_distance": 4500, "services_excellence_threshold": 6,
+		"expected_schools": 3.5, "max_schools_distance": 1600, "schools_bonus_threshold": INF,
+		"expected_shops": 15, "max_shop_distance": 2200, "expected_food_stores": 1.2,
+		"max_food_distance": 2800, "shops_excellence_threshold": 40,
+		"expected_healthcare": 2, "max_healthcare_distance": 2500, "expected_hospital": 0.4,
+		"max_hospital_distance": 6000, "hospital_bonus_threshold": INF,
+		"excellence_transport": INF, "excellence_shop": INF, "excellence_healthcare": INF,
+		"excellence_hospital": INF, "excellence_services": INF,
+		"excellence_bonus_1": 0, "excellence_bonus_2": 0, "excellence_bonus_3": 0, "excellence_bonus_4": 0,
+	},
+	"default": {
+		"tolerant_unemployment": 0, "job_ratio_factor": 12,
+		"expected_transport": 4, "max_transport_distance": 2000, "transport_bonus_threshold": 8,
+		"train_bonus_max": 12, "train_bonus_per_station": 10,
+		"expected_services": 2.5, "max_services_distance": 6500, "services_excellence_threshold": 4,
+		"expected_schools": 3, "max_schools_distance": 2200, "schools_bonus_threshold": INF,
+		"expected_shops": 10, "max_shop_distance": 3800, "expected_food_stores": 1.2,
+		"max_food_distance": 5500, "shops_excellence_threshold": 20,
+		"expected_healthcare": 0.8, "max_healthcare_distance": 6000, "expected_hospital": 0.2,
+		"max_hospital_distance": 20000, "hospital_bonus_threshold": INF,
+		"excellence_transport": INF, "excellence_shop": INF, "excellence_healthcare": INF,
+		"excellence_hospital": INF, "excellence_services": INF,
+		"excellence_bonus_1": 0, "excellence_bonus_2": 0, "excellence_bonus_3": 0, "excellence_bonus_4": 0,
+	},
+}, orient="index").astype(float)
+
+# Stats read by the scores and their default value when missing, as in Score.py
+DEFAULTS = {
+	"Proportion of unemployed": "0%",
+	"Job_Offer_in_Departement": 0,
+	"population": 1,
+	"Transport_nbr": 0,
+	"Transport_average_distance": 2000,
+	"Train_Station_nbr": 0,
+	"Public_Services_nbr": 0,
+	"Public_Services_average_distance": 3000,
+	"School_nbr": 0,
+	"School_average_distance": 1000,
+	"School_Under_Capacity_nbr": 0,
+	"School_Normal_nbr": 0,
+	"School_Optimal_nbr": 0,
+	"School_Total_nbr": 0,
+	"Shop_nbr": 0,
+	"Food Store_nbr": 0,
+	"Food Store_average_distance": 0,
+	"Healthcare_nbr": 0,
+	"Healthcare_average_distance": 0,
+	"Hospital_nbr": 0,
+	"Hospital_average_distance": 0,
+}
+
+def _school_charge_columns(school_charge):
+	if not isinstance(school_charge, dict):
+		school_charge = {}
+	status_recap = school_charge.get("Status_Recap", {})
+	if not isinstance(status_recap, dict):
+		status_recap = {}
+	return (
+		status_recap.get("Under Capacity", 0),
+		status_recap.get("Normal", 0),
+		status_recap.get("Optimal", 0),
+		school_charge.get("Total_of_Elementary_School", 0),
+	)
+
+def stats_frame(stats):
+	"""
+	Columns read by score_frame from a DataFrame, a structured array or a
+	list of stats dicts, with the School_Charge dict flattened into
+	School_*_nbr columns, the unemployment proportion parsed and the
+	defaults of Score.py for missing values. Its result can be given to
+	score_frame again as is.
+	"""
+	df = pd.DataFrame(stats)
+	frame = pd.DataFrame(index=df.index)
+	frame["city_type"] = df["city_type"].fillna("") if "city_type" in df else ""
+	if "School_Charge" in df and "School_Total_nbr" not in df:
+		columns = list(zip(*df["School_Charge"].map(_school_charge_columns))) or [(), (), (), ()]
+		names = ("School_Under_Capacity_nbr", "School_Normal_nbr", "School_Optimal_nbr", "School_Total_nbr")
+		for name, values in zip(names, columns):
+			df[name] = list(values)
+	for column, default in DEFAULTS.items():
+		if column in df:
+			frame[column] = df[column].where(df[column].notna(), default)
+		else:
+			frame[column] = default
+	# Shop_distance is the fallback of Shop_average_distance
+	shop_distance = df["Shop_distance"] if "Shop_distance" in df else pd.Series(0, index=df.index)
+	if "Shop_average_distance" in df:
+		shop_distance = df["Shop_average_distance"].where(df["Shop_average_distance"].notna(), shop_distance)
+	frame["Shop_average_distance"] = shop_distance.fillna(0)
+	# Parsed once so that a prepared frame can be scored many times
+	unemployment = frame["Proportion of unemployed"]
+	if not pd.api.types.is_numeric_dtype(unemployment):
+		frame["Proportion of unemployed"] = unemployment.astype(str).str.strip("%").map(float)
+	return frame
+
+def _column(frame, name):
+	return frame[name].to_numpy(dtype=float)
+
+def _distance_score(distance, max_distance, default):
+	return np.where(distance > 0, np.maximum(0, 100 - ((distance / max_distance) * 100)), default)
+
+def _clip_score(score):
+	return np.minimum(100, np.maximum(0, np.round(score))).astype(int)
+
+def work_scores(frame, thresholds):
+	unemployment = _column(frame, "Proportion of unemployed")
+	job_offers = _column(frame, "Job_Offer_in_Departement")
+	population = _column(frame, "population")
+	tolerant = thresholds["tolerant_unemployment"] == 1
+
+	tolerant_score = np.where(
+		unemployment <= 10, 100 - (unemployment * 3),
+		np.where(
+			unemployment <= 15, 70 - ((unemployment - 10) * 6),
+			np.maximum(0, 100 - (np.maximum(0, unemployment - 15) * 8))
+		)
+	)
+	unemployment_score = np.where(tolerant, tolerant_score, np.maximum(0, 100 - (unemployment * 5)))
+
+	with np.errstate(divide="ignore", invalid="ignore"):
+		job_ratio_per_1000 = np.where(population > 0, (job_offers / population) * 1000, 0)
+	job_opportunity_score = np.minimum(100, job_ratio_per_1000 * thresholds["job_ratio_factor"])
+
+	return _clip_score(unemployment_score * 0.6 + job_opportunity_score * 0.4)
+
+def transport_scores(frame, thresholds):
+	transport_nbr = _column(frame, "Transport_nbr")
+	bonus_threshold = thresholds["transport_bonus_threshold"]
+
+	base_density_score = np.minimum(100, (transport_nbr / thresholds["expected_transport"]) * 100)
+	excess_ratio = (transport_nbr - bonus_threshold) / bonus_threshold
+	density_bonus = np.where(transport_nbr > bonus_threshold, np.minimum(25, excess_ratio * 12), 0)
+	transport_density_score = np.minimum(100, base_density_score + density_bonus)
+
+	distance_score = _distance_score(
+		_column(frame, "Transport_average_distance"), thresholds["max_transport_distance"], 70
+	)
+	train_bonus = np.minimum(
+		thresholds["train_bonus_max"], _column(frame, "Train_Station_nbr") * thresholds["train_bonus_per_station"]
+	)
+
+	return _clip_score((transport_density_score * 0.5) + (distance_score * 0.3) + train_bonus)
+
+def public_services_scores(frame, thresholds):
+	services_nbr = _column(frame, "Public_Services_nbr")
+	excellence_threshold = thresholds["services_excellence_threshold"]
+
+	services_density_score = np.minimum(100, (services_nbr / thresholds["expected_services"]) * 100)
+	bonus = np.minimum(15, (services_nbr - excellence_threshold) * 2)
+	services_density_score = np.where(
+		services_nbr > excellence_threshold, np.minimum(100, services_density_score + bonus), services_density_score
+	)
+
+	distance_score = _distance_score(
+		_column(frame, "Public_Services_average_distance"), thresholds["max_services_distance"], 85
+	)
+
+	return _clip_score((services_density_score * 0.55) + (distance_score * 0.45))
+
+def education_scores(frame, thresholds):
+	schools_nbr = _column(frame, "School_nbr")
+	schools_distance = _column(frame, "School_average_distance")
+	total_schools = _column(frame, "School_Total_nbr")
+	bonus_threshold = thresholds["schools_bonus_threshold"]
+
+	school_density_score = np.minimum(100, (schools_nbr / thresholds["expected_schools"]) * 100)
+	bonus = np.minimum(15, (schools_nbr - 10) * 1.5)
+	school_density_score = np.where(
+		schools_nbr > bonus_threshold, np.minimum(100, school_density_score + bonus), school_density_score
+	)
+
+	distance_score = np.maximum(0, 100 - ((schools_distance / thresholds["max_schools_distance"]) * 100))
+
+	with np.errstate(divide="ignore", invalid="ignore"):
+		capacity_score = (
+			(_column(frame, "School_Under_Capacity_nbr") * 35) +
+			(_column(frame, "School_Normal_nbr") * 88) +
+			(_column(frame, "School_Optimal_nbr") * 100)
+		) / total_schools
+
+	return _clip_score(np.where(
+		total_schools > 0,
+		school_density_score * 0.25 + distance_score * 0.35 + capacity_score * 0.4,
+		school_density_score * 0.4 + distance_score * 0.6
+	))
+
+def commerce_scores(frame, thresholds):
+	shops_nbr = _column(frame, "Shop_nbr")
+	excellence_threshold = thresholds["shops_excellence_threshold"]
+
+	shops_density_score = np.minimum(100, (shops_nbr / thresholds["expected_shops"]) * 100)
+	bonus = np.minimum(20, (shops_nbr - excellence_threshold) / excellence_threshold * 15)
+	shops_density_score = np.where(
+		shops_nbr > excellence_threshold, np.minimum(100, shops_density_score + bonus), shops_density_score
+	)
+	shops_distance_score = _distance_score(_column(frame, "Shop_average_distance"), thresholds["max_shop_distance"], 75)
+
+	food_density_score = np.minimum(100, (_column(frame, "Food Store_nbr") / thresholds["expected_food_stores"]) * 100)
+	food_distance_score = _distance_score(
+		_column(frame, "Food Store_average_distance"), thresholds["max_food_distance"], 80
+	)
+
+	return _clip_score(
+		(shops_density_score * 0.35) +
+		(shops_distance_score * 0.15) +
+		(food_density_score * 0.35) +
+		(food_distance_score * 0.15)
+	)
+
+def health_scores(frame, thresholds):
+	hospital_nbr = _column(frame, "Hospital_nbr")
+	expected_hospital = thresholds["expected_hospital"]
+	bonus_threshold = thresholds["hospital_bonus_threshold"]
+
+	healthcare_density_score = np.minimum(
+		100, (_column(frame, "Healthcare_nbr") / thresholds["expected_healthcare"]) * 100
+	)
+	healthcare_distance_score = _distance_score(
+		_column(frame, "Healthcare_average_distance"), thresholds["max_healthcare_distance"], 60
+	)
+	healthcare_score = (healthcare_density_score * 0.6) + (healthcare_distance_score * 0.4)
+
+	hospital_density_score = np.minimum(100, (hospital_nbr / expected_hospital) * 100)
+	hospital_distance_score = _distance_score(
+		_column(frame, "Hospital_average_distance"), thresholds["max_hospital_distance"], 50
+	)
+	bonus = np.minimum(15, (hospital_nbr - 5) * 3)
+	hospital_density_score = np.where(
+		hospital_nbr > bonus_threshold, np.minimum(100, hospital_density_score + bonus), hospital_density_score
+	)
+
+	hospital_score = np.where(
+		expected_hospital <= 0.3,
+		(hospital_density_score * 0.2) + (hospital_distance_score * 0.8),
+		(hospital_density_score * 0.5) + (hospital_distance_score * 0.5)
+	)
+
+	return _clip_score((healthcare_score * 0.4) + (hospital_score * 0.6))
+
+def excellence_bonuses(frame, thresholds):
+	excellence_factors = (
+		(_column(frame, "Transport_nbr") > thresholds["excellence_transport"]).astype(int) +
+		(_column(frame, "Shop_nbr") > thresholds["excellence_shop"]).astype(int) +
+		(
+			(_column(frame, "Healthcare_nbr") > thresholds["excellence_healthcare"]) &
+			(_column(frame, "Hospital_nbr") > thresholds["excellence_hospital"])
+		).astype(int) +
+		(_column(frame, "Public_Services_nbr") > thresholds["excellence_services"]).astype(int)
+	)
+	bonus_by_factors = np.column_stack(
+		[np.zeros(len(frame))] + [thresholds[f"excellence_bonus_{count}"] for count in range(1, 5)]
+	)
+	return bonus_by_factors[np.arange(len(frame)), excellence_factors].astype(int)
+
+def score_frame(stats, weights=WEIGHTS, thresholds=THRESHOLDS):
+	"""
+	Scores of every site of stats (see stats_frame), same columns and values
+	as Score.calculate_cost_score. Other weights can be given for what-if
+	comparisons of the global score.
+	"""
+	frame = stats_frame(stats)
+	city_types = frame["city_type"].where(frame["city_type"].isin(thresholds.index), "default")
+	rows = thresholds.loc[city_types.to_numpy()]
+	site_thresholds = {name: rows[name].to_numpy() for name in thresholds.columns}
+
+	scores = pd.DataFrame({
+		"Travail": work_scores(frame, site_thresholds),
+		"Transport": transport_scores(frame, site_thresholds),
+		"Service public": public_services_scores(frame, site_thresholds),
+		"Éducation": education_scores(frame, site_thresholds),
+		"Commerce": commerce_scores(frame, site_thresholds),
+		"Santé": health_scores(frame, site_thresholds),
+	}, index=frame.index)
+
+	global_score = np.zeros(len(frame))
+	for category in scores.columns:
+		global_score = global_score + scores[category].to_numpy() * weights[category]
+	global_score = global_score + excellence_bonuses(frame, site_thresholds)
+	scores["Global"] = np.round(np.minimum(100, global_score), 0)
+	return scores
@@ -0,0 +1,67 @@
+import math
+import numpy as np
+
+EARTH_RADIUS = 6371000
+
+def bbox_around(lat, lon, radius):
+	"""
+	(south, west, north, east) box containing every point within `radius`
+	meters of the given point, with the same earth radius as utils.haversine
+	"""
+	angle = radius / EARTH_RADIUS
+	dlat = math.degrees(angle)
+	cos_lat = math.cos(math.radians(lat))
+	if cos_lat <= math.sin(angle):
+		dlon = 180
+	else:
+		dlon = math.degrees(math.asin(math.sin(angle) / cos_lat))
+	return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+class GridIndex:
+	"""
+	Points stored as contiguous radian arrays and bucketed in a grid of
+	cell_degrees cells. Radius queries only compute the distance of the
+	points of the cells intersecting the circle bounding box.
+	"""
+
+	def __init__(self, lats, lons, cell_degrees=0.05):
+		self.cell_degrees = cell_degrees
+		self.lats = np.ascontiguousarray(lats, dtype=float)
+		self.lons = np.ascontiguousarray(lons, dtype=float)
+		self.lat_rad = np.radians(self.lats)
+		self.lon_rad = np.radians(self.lons)
+		self.cos_lat = np.cos(self.lat_rad)
+		valid = np.flatnonzero(np.isfinite(self.lats) & np.isfinite(self.lons))
+		cells_lat = np.floor(self.lats[valid] / cell_degrees).astype(int)
+		cells_lon = np.floor(self.lons[valid] / cell_degrees).astype(int)
+		cells = {}
+		for index, cell_lat, cell_lon in zip(valid, cells_lat, cells_lon):
+			cells.setdefault((cell_lat, cell_lon), []).append(index)
+		self.cells = {cell: np.array(indexes, dtype=int) for cell, indexes in cells.items()}
+
+	def candidates(self, lat, lon, radius):
+		"""Indexes of the points of the cells intersecting the circle bounding box, in ascending order"""
+		south, west, north, east = bbox_around(lat, lon, radius)
+		min_lat, max_lat = math.floor(south / self.cell_degrees), math.floor(north / self.cell_degrees)
+		min_lon, max_lon = math.floor(west / self.cell_degrees), math.floor(east / self.cell_degrees)
+		if (max_lat - min_lat + 1) * (max_lon - min_lon + 1) > len(self.cells):
+			found = [indexes for (cell_lat, cell_lon), indexes in self.cells.items()
+				if min_lat <= cell_lat <= max_lat and min_lon <= cell_lon <= max_lon]
+		else:
+			found = [self.cells[(i, j)] for i in range(min_lat, max_lat + 1) for j in range(min_lon, max_lon + 1) if (i, j) in self.cells]
+		return np.sort(np.concatenate(found)) if found else np.array([], dtype=int)
+
+	def distances(self, lat, lon, indexes):
+		"""Haversine distances in meters from the point to the indexed points"""
+		phi1 = math.radians(lat)
+		dphi = self.lat_rad[indexes] - phi1
+		dlambda = self.lon_rad[indexes] - math.radians(lon)
+		a = np.sin(dphi/2)**2 + math.cos(phi1) * self.cos_lat[indexes] * np.sin(dlambda/2)**2
+		return EARTH_RADIUS * 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+
+	def within(self, lat, lon, radius):
+		"""(indexes, distances) of the points within `radius` meters, indexes in ascending order"""
+		indexes = self.candidates(lat, lon, radius)
+		distances = self.distances(lat, lon, indexes)
+		keep = distances <= radius
+		return indexes[keep], distances[keep]
@@ -0,0 +1,119 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import spatial
+
+TILE_CACHE_PATH = os.environ.get("OSM_TILE_CACHE_PATH", "./data/osm_tiles.sqlite3")
+TILE_ZOOM = int(os.environ.get("OSM_TILE_ZOOM", 14))
+TILE_TTL = float(os.environ.get("OSM_TILE_TTL", 7 * 24 * 3600))
+TILE_MAX_ENTRIES = int(os.environ.get("OSM_TILE_MAX_ENTRIES", 200000))
+SQLITE_MAX_PARAMS = 900
+
+def tile_of(lat, lon, zoom=TILE_ZOOM):
+	"""Slippy map tile (x, y) containing the point"""
+	n = 2 ** zoom
+	lat = max(-85.0511, min(85.0511, lat))
+	x = int((lon + 180) / 360 * n)
+	y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+	return min(n - 1, max(0, x)), min(n - 1, max(0, y))
+
+def tile_bounds(x, y, zoom=TILE_ZOOM):
+	"""(south, west, north, east) of a slippy map tile"""
+	n = 2 ** zoom
+	def lat_of(tile_y):
+		return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+	return lat_of(y + 1), x / n * 360 - 180, lat_of(y), (x + 1) / n * 360 - 180
+
+def tiles_around(lat, lon, radius, zoom=TILE_ZOOM):
+	"""Every tile intersecting the bounding box of the circle"""
+	south, west, north, east = spatial.bbox_around(lat, lon, radius)
+	min_x, min_y = tile_of(north, west, zoom)
+	max_x, max_y = tile_of(south, east, zoom)
+	return [(x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+
+def tiles_bounds(tiles, zoom=TILE_ZOOM):
+	"""(south, west, north, east) envelope of a set of tiles"""
+	bounds = [tile_bounds(x, y, zoom) for x, y in tiles]
+	return min(b[0] for b in bounds), min(b[1] for b in bounds), max(b[2] for b in bounds), max(b[3] for b in bounds)
+
+def tile_key(info_type, info_filter, tile, zoom=TILE_ZOOM):
+	return f"{info_type}={info_filter or '*'}/{zoom}/{tile[0]}/{tile[1]}"
+
+class TileCache:
+	"""
+	SQLite store of the OSM elements of one (tag, filter, tile) per row, with
+	a time to live and a least recently used eviction above max_entries
+	"""
+
+	def __init__(self, path=TILE_CACHE_PATH, ttl=TILE_TTL, max_entries=TILE_MAX_ENTRIES):
+		self.path = path
+		self.ttl = ttl
+		self.max_entries = max_entries
+		self.hits = 0
+		self.misses = 0
+		self._lock = threading.Lock()
+		self._local = threading.local()
+
+	def _connection(self):
+		conn = getattr(self._local, "conn", None)
+		if conn is None:
+			conn = sqlite3.connect(self.path, timeout=10)
+			conn.execute("PRAGMA journal_mode=WAL")
+			conn.execute('CREATE TABLE IF NOT EXISTS "tiles" ("key" TEXT PRIMARY KEY, "elements" TEXT NOT NULL, "fetched_at" REAL NOT NULL, "accessed_at" REAL NOT NULL)')
+			conn.execute('CREATE INDEX IF NOT EXISTS "tiles_accessed_at" ON "tiles" ("accessed_at")')
+			self._local.conn = conn
+		return conn
+
+	def get_many(self, keys):
+		"""Returns {key: elements} for the fresh cached keys"""
+		keys = list(keys)
+		found = {}
+		now = time.time()
+		conn = self._connection()
+		for start in range(0, len(keys), SQLITE_MAX_PARAMS):
+			chunk = keys[start:start + SQLITE_MAX_PARAMS]
+			placeholders = ",".join("?" * len(chunk))
+			rows = conn.execute(f'SELECT "key", "elements" FROM "tiles" WHERE "key" IN ({placeholders}) AND "fetched_at" >= ?', chunk + [now - self.ttl])
+			for key, elements in rows:
+				found[key] = json.loads(elements)
+		with conn:
+			for start in range(0, len(keys), SQLITE_MAX_PARAMS):
+				chunk = [key for key in keys[start:start + SQLITE_MAX_PARAMS] if key in found]
+				if chunk:
+					placeholders = ",".join("?" * len(chunk))
+					conn.execute(f'UPDATE "tiles" SET "accessed_at" = ? WHERE "key" IN ({placeholders})', [now] + chunk)
+		with self._lock:
+			self.hits += len(found)
+			self.misses += len(keys) - len(found)
+		return found
+
+	def set_many(self, items):
+		"""Stores {key: elements} then evicts expired and least recently used rows"""
+		now = time.time()
+		conn = self._connection()
+		with conn:
+			conn.executemany(
+				'INSERT OR REPLACE INTO "tiles" ("key", "elements", "fetched_at", "accessed_at") VALUES (?, ?, ?, ?)',
+				[(key, json.dumps(elements), now, now) for key, elements in items.items()]
+			)
+			conn.execute('DELETE FROM "tiles" WHERE "fetched_at" < ?', (now - self.ttl,))
+			excess = conn.execute('SELECT COUNT(*) FROM "tiles"').fetchone()[0] - self.max_entries
+			if excess > 0:
+				conn.execute('DELETE FROM "tiles" WHERE "key" IN (SELECT "key" FROM "tiles" ORDER BY "accessed_at" LIMIT ?)', (excess,))
+
+	def stats(self):
+		with self._lock:
+			hits, misses = self.hits, self.misses
+		total = hits + misses
+		return {
+			"hits": hits,
+			"misses": misses,
+			"hit_ratio": round(hits / total, 3) if total else 0,
+			"entries": self._connection().execute('SELECT COUNT(*) FROM "tiles"').fetchone()[0],
+		}
+
+# Process-wide cache, disabled with OSM_TILE_CACHE_PATH=""
+cache = TileCache() if TILE_CACHE_PATH else None
@@ -0,0 +1,320 @@
+import contextvars
+import functools
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Upper bounds in seconds of the histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Directory shared by the worker processes of a server (set by gunicorn.conf.py).
+# Each one writes its metrics there every METRICS_FLUSH_INTERVAL seconds and
+# when it exits, so that any of them reports the sum of all of them, the
+# workers that were recycled included. Empty, only this process is reported.
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+# Sum of the metrics of the exited processes, their own files are removed once folded in it
+EXITED_FILE = "exited.json"
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", 10))
+
+class Histogram:
+	"""Cumulative Prometheus histogram of durations in seconds"""
+
+	def __init__(self):
+		self.counts = [0] * len(BUCKETS)
+		self.count = 0
+		self.sum = 0.0
+
+	def add(self, other):
+		self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+		self.count += other.count
+		self.sum += other.sum
+
+	def as_dict(self):
+		return {"counts": self.counts, "count": self.count, "sum": self.sum}
+
+	@classmethod
+	def from_dict(cls, data):
+		histogram = cls()
+		histogram.counts, histogram.count, histogram.sum = list(data["counts"]), data["count"], data["sum"]
+		return histogram
+
+	def observe(self, value):
+		for index, bound in enumerate(BUCKETS):
+			if value <= bound:
+				self.counts[index] += 1
+		self.count += 1
+		self.sum += value
+
+_lock = threading.Lock()
+_stages = {}
+_upstreams = {}
+_upstream_requests = {}
+_upstream_request_bytes = {}
+_upstream_response_bytes = {}
+# Functions returning extra {name: (help, value)} counters, written with the metrics of the process
+_counter_sources = []
+# Process owning the metrics above, they are reset in a forked worker
+_owner = {"pid": None, "path": None}
+
+# Timings of the request being traced, shared with the threads of fetcher.run_all
+_trace = contextvars.ContextVar("trace", default=None)
+
+def _own():
+	"""
+	Resets the metrics inherited from the parent process and starts the
+	flush thread, in a new process. Holds _lock.
+	"""
+	if _owner["pid"] == os.getpid():
+		return
+	for metrics in (_stages, _upstreams, _upstream_requests, _upstream_request_bytes, _upstream_response_bytes):
+		metrics.clear()
+	_owner["pid"] = os.getpid()
+	if METRICS_DIR:
+		# The start time tells apart the files of two processes with the same pid
+		_owner["path"] = os.path.join(METRICS_DIR, f"{os.getpid()}-{time.time_ns()}.json")
+		threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+def register_counters(source):
+	"""Adds a function returning {name: (help, value)} counters of this process, summed over the workers"""
+	_counter_sources.append(source)
+
+def _counters():
+	counters = {}
+	for source in _counter_sources:
+		counters.update(source())
+	return counters
+
+def _snapshot():
+	# Read before taking the lock, the sources may be slow
+	counters = _counters()
+	with _lock:
+		_own()
+		return {
+			"stages": {stage: histogram.as_dict() for stage, histogram in _stages.items()},
+			"upstreams": {host: histogram.as_dict() for host, histogram in _upstreams.items()},
+			"upstream_requests": [[host, status, count] for (host, status), count in _upstream_requests.items()],
+			"upstream_request_bytes": dict(_upstream_request_bytes),
+			"upstream_response_bytes": dict(_upstream_response_bytes),
+			"counters": {name: list(counter) for name, counter in counters.items()},
+		}
+
+def flush():
+	"""Writes the metrics of this process to METRICS_DIR"""
+	if not METRICS_DIR:
+		return
+	snapshot = _snapshot()
+	os.makedirs(METRICS_DIR, exist_ok=True)
+	_write(_owner["path"], snapshot)
+
+def _flush_loop():
+	while True:
+		time.sleep(METRICS_FLUSH_INTERVAL)
+		try:
+			flush()
+		except OSError:
+			pass
+
+def _read(path):
+	with open(path, "r", encoding="utf-8") as f:
+		return json.load(f)
+
+def _write(path, snapshot):
+	temporary = path + ".tmp"
+	with open(temporary, "w", encoding="utf-8") as f:
+		json.dump(snapshot, f)
+	os.replace(temporary, path)
+
+def _exited():
+	try:
+		return _read(os.path.join(METRICS_DIR, EXITED_FILE))
+	except (OSError, ValueError):
+		return {"folded": []}
+
+def _other_processes():
+	"""Metrics written by the other processes, the sum of the exited ones included"""
+	if not METRICS_DIR:
+		return []
+	paths = [path for path in glob.glob(os.path.join(METRICS_DIR, "*.json"))
+		if path != _owner["path"] and os.path.basename(path) != EXITED_FILE]
+	exited = _exited()
+	snapshots = {}
+	for path in paths:
+		try:
+			snapshots[os.path.basename(path)] = _read(path)
+		except FileNotFoundError:
+			# Folded meanwhile, the exited sum was written before the file was removed
+			exited = _exited()
+		except (OSError, ValueError):
+			continue
+	return [exited] + [snapshot for name, snapshot in snapshots.items() if name not in exited["folded"]]
+
+def mark_process_dead(pid):
+	"""
+	Folds the metrics of an exited process into EXITED_FILE and removes its
+	file, so that the directory does not grow with every recycled worker.
+	Called by the gunicorn master, which is the only writer of EXITED_FILE.
+	"""
+	if not METRICS_DIR:
+		return
+	paths = glob.glob(os.path.join(METRICS_DIR, f"{pid}-*.json"))
+	if not paths:
+		return
+	exited = _exited()
+	snapshots = [exited]
+	for path in paths:
+		try:
+			snapshots.append(_read(path))
+		except (OSError, ValueError):
+			continue
+	merged = _merge(snapshots)
+	names = [os.path.basename(path) for path in paths]
+	# Readers skip the folded files still listed, only the ones not removed yet are kept in the list
+	merged["folded"] = [name for name in exited["folded"] if os.path.exists(os.path.join(METRICS_DIR, name))] + names
+	_write(os.path.join(METRICS_DIR, EXITED_FILE), merged)
+	for path in paths:
+		try:
+			os.remove(path)
+		except OSError:
+			pass
+
+def _observe_stage(stage, duration):
+	with _lock:
+		_own()
+		_stages.setdefault(stage, Histogram()).observe(duration)
+		trace = _trace.get()
+		if trace is not None:
+			trace[stage] = trace.get(stage, 0) + duration
+
+@contextmanager
+def span(stage):
+	"""Times the block as one occurrence of the stage"""
+	start = time.monotonic()
+	try:
+		yield
+	finally:
+		_observe_stage(stage, time.monotonic() - start)
+
+def traced(stage, func):
+	"""func timed as the stage on every call"""
+	@functools.wraps(func)
+	def wrapper(*args, **kwargs):
+		with span(stage):
+			return func(*args, **kwargs)
+	return wrapper
+
+@contextmanager
+def trace():
+	"""
+	Collects the total seconds spent in each stage inside the block, summed
+	when a stage runs several times, in the yielded dict
+	"""
+	timings = {}
+	token = _trace.set(timings)
+	try:
+		yield timings
+	finally:
+		_trace.reset(token)
+
+def observe_upstream(url, duration, status="", request_bytes=0, response_bytes=0):
+	host = urlsplit(url).hostname or url
+	with _lock:
+		_own()
+		_upstreams.setdefault(host, Histogram()).observe(duration)
+		key = (host, str(status))
+		_upstream_requests[key] = _upstream_requests.get(key, 0) + 1
+		_upstream_request_bytes[host] = _upstream_request_bytes.get(host, 0) + request_bytes
+		_upstream_response_bytes[host] = _upstream_response_bytes.get(host, 0) + response_bytes
+
+def _label(value):
+	return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _histogram_lines(name, label, histograms):
+	lines = []
+	for value, histogram in sorted(histograms.items()):
+		labels = f'{label}="{_label(value)}"'
+		for bound, count in zip(BUCKETS, histogram.counts):
+			lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+		lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+		lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+		lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+	return lines
+
+def _add(totals, key, value):
+	totals[key] = totals.get(key, 0) + value
+
+def _merge(snapshots):
+	"""Sum of the metrics snapshots, as one snapshot"""
+	stages, upstreams = {}, {}
+	upstream_requests, upstream_request_bytes, upstream_response_bytes = {}, {}, {}
+	counters, counter_help = {}, {}
+	for snapshot in snapshots:
+		for histograms, totals in ((snapshot.get("stages", {}), stages), (snapshot.get("upstreams", {}), upstreams)):
+			for key, data in histograms.items():
+				totals.setdefault(key, Histogram()).add(Histogram.from_dict(data))
+		for host, status, count in snapshot.get("upstream_requests", []):
+			_add(upstream_requests, (host, status), count)
+		for host, count in snapshot.get("upstream_request_bytes", {}).items():
+			_add(upstream_request_bytes, host, count)
+		for host, count in snapshot.get("upstream_response_bytes", {}).items():
+			_add(upstream_response_bytes, host, count)
+		for name, (help_text, value) in snapshot.get("counters", {}).items():
+			counter_help[name] = help_text
+			_add(counters, name, value)
+	return {
+		"stages": {stage: histogram.as_dict() for stage, histogram in stages.items()},
+		"upstreams": {host: histogram.as_dict() for host, histogram in upstreams.items()},
+		"upstream_requests": [[host, status, count] for (host, status), count in upstream_requests.items()],
+		"upstream_request_bytes": upstream_request_bytes,
+		"upstream_response_bytes": upstream_response_bytes,
+		"counters": {name: [counter_help[name], value] for name, value in counters.items()},
+	}
+
+def render(gauges=None):
+	"""
+	Prometheus text exposition of the stage and upstream metrics, and of the
+	registered counters, summed over the worker processes when METRICS_DIR is
+	set, followed by the extra {name: (help, value)} gauges of this process
+	"""
+	total = _merge([_snapshot()] + _other_processes())
+	stages = {stage: Histogram.from_dict(data) for stage, data in total["stages"].items()}
+	upstreams = {host: Histogram.from_dict(data) for host, data in total["upstreams"].items()}
+	upstream_requests = {(host, status): count for host, status, count in total["upstream_requests"]}
+	upstream_request_bytes = total["upstream_request_bytes"]
+	upstream_response_bytes = total["upstream_response_bytes"]
+	counters = {name: value for name, (_, value) in total["counters"].items()}
+	counter_help = {name: help_text for name, (help_text, _) in total["counters"].items()}
+
+	lines = [
+		"# HELP costia_stage_duration_seconds Duration of the search pipeline stages",
+		"# TYPE costia_stage_duration_seconds histogram",
+	] + _histogram_lines("costia_stage_duration_seconds", "stage", stages) + [
+		"# HELP costia_upstream_duration_seconds Duration of the HTTP calls per upstream host",
+		"# TYPE costia_upstream_duration_seconds histogram",
+	] + _histogram_lines("costia_upstream_duration_seconds", "host", upstreams) + [
+		"# HELP costia_upstream_requests_total HTTP calls per upstream host and status",
+		"# TYPE costia_upstream_requests_total counter",
+	] + [
+		f'costia_upstream_requests_total{{host="{_label(host)}",status="{_label(status)}"}} {count}'
+		for (host, status), count in sorted(upstream_requests.items())
+	] + [
+		"# HELP costia_upstream_request_bytes_total Bytes sent per upstream host",
+		"# TYPE costia_upstream_request_bytes_total counter",
+	] + [
+		f'costia_upstream_request_bytes_total{{host="{_label(host)}"}} {count}'
+		for host, count in sorted(upstream_request_bytes.items())
+	] + [
+		"# HELP costia_upstream_response_bytes_total Bytes received per upstream host",
+		"# TYPE costia_upstream_response_bytes_total counter",
+	] + [
+		f'costia_upstream_response_bytes_total{{host="{_label(host)}"}} {count}'
+		for host, count in sorted(upstream_response_bytes.items())
+	]
+	for name, value in sorted(counters.items()):
+		lines += [f"# HELP {name} {counter_help[name]}", f"# TYPE {name} counter", f"{name} {value}"]
+	for name, (help_text, value) in (gauges or {}).items():
+		lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+	return "\n".join(lines) + "\n"
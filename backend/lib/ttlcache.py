@@ -0,0 +1,47 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+	"""
+	Thread-safe in-memory mapping whose entries expire after `ttl` seconds,
+	evicting the least recently used ones above `max_entries`
+	"""
+
+	def __init__(self, max_entries=1024, ttl=3600):
+		self.max_entries = max_entries
+		self.ttl = ttl
+		self.hits = 0
+		self.misses = 0
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key, default=None):
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None or entry[0] < time.monotonic():
+				if entry is not None:
+					del self._entries[key]
+				self.misses += 1
+				return default
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return entry[1]
+
+	def set(self, key, value):
+		with self._lock:
+			self._entries[key] = (time.monotonic() + self.ttl, value)
+			self._entries.move_to_end(key)
+			while len(self._entries) > self.max_entries:
+				self._entries.popitem(last=False)
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+
+	def stats(self):
+		with self._lock:
+			return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+	def __len__(self):
+		return len(self._entries)
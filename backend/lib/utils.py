@@ -1,5 +1,17 @@
-import requests
+import os
+import re
 import math
+import fetcher
+import httpclient
+import ttlcache
+
+GEOCODE_PRECISION = int(os.environ.get("GEOCODE_PRECISION", 5))
+GEOCODE_CACHE_TTL = float(os.environ.get("GEOCODE_CACHE_TTL", 24 * 3600))
+GEOCODE_CACHE_SIZE = int(os.environ.get("GEOCODE_CACHE_SIZE", 10000))
+
+_geocode_cache = ttlcache.TTLCache(GEOCODE_CACHE_SIZE, GEOCODE_CACHE_TTL)
+_reverse_geocode_cache = ttlcache.TTLCache(GEOCODE_CACHE_SIZE, GEOCODE_CACHE_TTL)
+_MISSING = object()
 
 def haversine(lat1, lon1, lat2, lon2):
 	R = 6371000
@@ -12,31 +24,60 @@ def haversine(lat1, lon1, lat2, lon2):
 	return R * c
 
 def geocode_adresse(adresse):
+	key = re.sub(r"\s+", " ", str(adresse)).strip().lower()
+	coords = _geocode_cache.get(key, _MISSING)
+	if coords is _MISSING:
+		coords = _geocode_adresse(adresse)
+		_geocode_cache.set(key, coords)
+	return coords
+
+def _geocode_adresse(adresse):
 	url = "https://api-adresse.data.gouv.fr/search/"
 	params = {"q": adresse, "limit": 1}
-	resp = requests.get(url, params=params)
+	resp = fetcher.with_retries(httpclient.get, url, params=params)
 	data = resp.json()
 	if data["features"]:
 		coords = data["features"][0]["geometry"]["coordinates"]  # [lon, lat]
 		return coords[1], coords[0]
 	return None, None
 
-def get_city_from_coords(lat, lon):
+def reverse_geocode_infos(lat, lon):
+	"""
+	Label, city, citycode (INSEE code) and postcode of the address closest
+	to the coordinates, from a single reverse geocoding call cached by
+	coordinates rounded to GEOCODE_PRECISION decimals
+	"""
+	key = (round(float(lat), GEOCODE_PRECISION), round(float(lon), GEOCODE_PRECISION))
+	infos = _reverse_geocode_cache.get(key)
+	if infos is None:
+		infos = _reverse_geocode_infos(lat, lon)
+		_reverse_geocode_cache.set(key, infos)
+	return infos
+
+def _reverse_geocode_infos(lat, lon):
 	url = "https://api-adresse.data.gouv.fr/reverse/"
 	params = {"lat": lat, "lon": lon}
-	resp = requests.get(url, params=params)
+	resp = fetcher.with_retries(httpclient.get, url, params=params)
 	data = resp.json()
+	infos = {"label": "Adresse inconnue", "city": "Ville inconnue", "citycode": None, "postcode": None}
 	if data["features"]:
 		props = data["features"][0]["properties"]
+		infos["label"] = props["label"]
+		infos["citycode"] = props.get("citycode")
+		infos["postcode"] = props.get("postcode")
 		for key in ["city", "town", "village", "municipality"]:
 			if key in props:
-				return props[key]
-	return "Ville inconnue"
+				infos["city"] = props[key]
+				break
+	return infos
+
+def get_city_from_coords(lat, lon):
+	return reverse_geocode_infos(lat, lon)["city"]
 
 def get_area_id(ville):
 	url = "https://nominatim.openstreetmap.org/search"
 	params = {"q": ville, "format": "json", "polygon_geojson": 0}
-	r = requests.get(url, params=params, headers={"User-Agent": "OSM script"})
+	r = httpclient.get(url, params=params)
 	data = r.json()
 	for place in data:
 		if place.get("osm_type") == "relation":
@@ -44,10 +85,4 @@ def get_area_id(ville):
 	return None
 
 def reverse_geocode(lat, lon):
-	url = "https://api-adresse.data.gouv.fr/reverse"
-	params = {"lat": lat, "lon": lon}
-	resp = requests.get(url, params=params)
-	data = resp.json()
-	if data["features"]:
-		return data["features"][0]["properties"]["label"]
-	return "Adresse inconnue"
+	return reverse_geocode_infos(lat, lon)["label"]
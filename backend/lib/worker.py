@@ -1,90 +1,58 @@
-import pandas as pd
-import re
-import unicodedata
+import communedb
+import names
+import logs
 
-def normalize(text):
-	if not isinstance(text, str):
-		text = str(text)
-	text = text.lower()
-	text = unicodedata.normalize('NFKD', text).encode('ASCII', 'ignore').decode('utf-8')
-	return text
+logger = logs.get_logger("worker")
 
-def get_unemployed(nom_ville, csv_path="./data/raw/Unemployed.csv"):
+def get_unemployed(nom_ville, db_path=communedb.COMMUNES_DB_PATH, code_insee=None):
+	"""
+	With code_insee, the count joined to the commune by `manage.py ingest`,
+	else the first row of Unemployed.csv matching nom_ville
+	"""
 	try :
-		nom_ville_norm = normalize(nom_ville)
-		df = pd.read_csv(csv_path, sep=";", encoding="utf-8")
-
-		if 'Commune' not in df.columns or 'nbr' not in df.columns:
-			print(f"Erreur: Les colonnes attendues ne sont pas présentes dans le fichier CSV")
-			return None
-
-		df['Commune'] = df['Commune'].str.strip()
-		df['nbr'] = df['nbr'].astype(str).str.replace(" ", "")
-		df['Commune_norm'] = df['Commune'].apply(normalize)
-
-		def extract_ville_name(commune):
-			match = re.match(r"(.+?)\s+\d{5}$", commune)
-			return match.group(1).strip() if match else commune
-
-		df['Commune_short'] = df['Commune'].apply(extract_ville_name)
-		df['Commune_short_norm'] = df['Commune_short'].apply(normalize)
-
-		match = df[df['Commune_norm'] == nom_ville_norm]
-
-		if match.empty:
-			match = df[df['Commune_short_norm'] == nom_ville_norm]
-
-		if match.empty:
-			match = df[df['Commune_norm'].str.contains(nom_ville_norm)]
-		if not match.empty:
-			row = match.iloc[0]
+		commune = communedb.find_by_code("communes", "code_insee", code_insee, db_path) if code_insee else None
+		if commune is not None and commune["unemployed"] is not None:
+			return {
+				"commune": str(commune["displayname"]),
+				"nbr_unemployed": int(commune["unemployed"])
+			}
+		nom_ville_norm = names.normalize(nom_ville)
+		row = communedb.find_by_name("unemployed", nom_ville_norm, db_path)
+		if row is not None:
 			return {
-				"commune": str(row["Commune"]),
+				"commune": str(row["commune"]),
 				"nbr_unemployed": int(row["nbr"])
 			}
 		else:
 			return None
 	except Exception as e:
-		print(f"Erreur lors de la recherche des données de chômage: {e}")
+		logger.warning("Erreur lors de la recherche des données de chômage: %s", e)
 		return None
 
-def get_job_offer_in_dep(nom_departement, csv_path="./data/raw/JobOffer.csv"):
+def get_job_offer_in_dep(nom_departement, db_path=communedb.COMMUNES_DB_PATH, code_insee=None):
+	"""
+	With code_insee, the count of the commune department joined by
+	`manage.py ingest`, else the first row of JobOffer.csv matching
+	nom_departement
+	"""
 	try :
-		nom_departement_norm = normalize(nom_departement)
-		df = pd.read_csv(csv_path, sep=";", encoding="utf-8")
-
-		if 'Departement' not in df.columns or 'nbr' not in df.columns:
-			print(f"Erreur: Les colonnes attendues ne sont pas présentes dans le fichier CSV")
-			return None
-
-		df['Departement'] = df['Departement'].str.strip()
-		df['nbr'] = df['nbr'].astype(str).str.replace(" ", "")
-		df['Departement_norm'] = df['Departement'].apply(normalize)
-
-		def extract_ville_name(departement):
-			match = re.match(r"(.+?)\s+\d{5}$", departement)
-			return match.group(1).strip() if match else departement
-
-		df['Departement_short'] = df['Departement'].apply(extract_ville_name)
-		df['Departement_short_norm'] = df['Departement_short'].apply(normalize)
-
-		match = df[df['Departement_norm'] == nom_departement_norm]
-
-		if match.empty:
-			match = df[df['Departement_short_norm'] == nom_departement_norm]
-
-		if match.empty:
-			match = df[df['Departement_norm'].str.contains(nom_departement_norm)]
-		if not match.empty:
-			row = match.iloc[0]
+		commune = communedb.find_by_code("communes", "code_insee", code_insee, db_path) if code_insee else None
+		if commune is not None and commune["job_offers"] is not None:
+			return {
+				"departement": str(commune["dep_nom"]),
+				"job_offer": int(commune["job_offers"])
+			}
+		nom_departement_norm = names.normalize(nom_departement)
+		row = communedb.find_by_name("job_offers", nom_departement_norm, db_path)
+		if row is not None:
 			return {
-				"departement": str(row["Departement"]),
+				"departement": str(row["departement"]),
 				"job_offer": int(row["nbr"])
 			}
 		else:
 			return None
 	except Exception as e:
-		print(f"Erreur lors de la recherche des données d'offre d'emploi': {e}")
+		logger.warning("Erreur lors de la recherche des données d'offre d'emploi: %s", e)
 		return None
 
 
@@ -301,6 +301,21 @@ export default function HackathonApp() {
 		const lon = parseFloat(lonInput);
 		setCoords(!isNaN(lat) && !isNaN(lon) ? { lat, lon } : null);
 	};
+	// Stream the AI resume of the current search into locationData
+	const resumeSource = useRef<EventSource | null>(null)
+	const streamResume = (resumeId: string) => {
+		resumeSource.current?.close()
+		const source = new EventSource(`http://localhost:8000/api/resume/${resumeId}/stream/`)
+		resumeSource.current = source
+		source.onmessage = (event) => {
+			const content: string = JSON.parse(event.data)
+			setLocationData((prev) => prev && { ...prev, resume: (prev.resume || "") + content })
+		}
+		source.addEventListener("end", () => source.close())
+		source.onerror = () => source.close()
+	}
+	useEffect(() => () => resumeSource.current?.close(), [])
+
 	// Handle search
 	const handleSearch = async () => {
 		if (!coords && !address.trim()) return
@@ -313,16 +328,16 @@ export default function HackathonApp() {
 				coordinates: coords,
 				address: address.trim(),
 				city: address.trim().split(",")[1]?.trim()?.substring(5)?.trim() || undefined,
+				resume: false,
 			})
-			// The API returns { stats: {...}, formatted_output: "...", resume: "...", filename: "..." }
+			// The API returns { stats: {...}, formatted_output: "...", resume_id: "...", filename: "..." }
 			// We need the stats object which contains the enhanced location data
 			if (response.data.stats && typeof response.data.stats === 'object') {
-				const locationDataWithResume = { ...response.data.stats }
-				// Add the resume if it exists
-				if (response.data.resume) {
-					locationDataWithResume.resume = response.data.resume
+				setLocationData({ ...response.data.stats })
+				// The AI resume is streamed afterwards so the stats show up without waiting for it
+				if (response.data.resume_id) {
+					streamResume(response.data.resume_id)
 				}
-				setLocationData(locationDataWithResume)
 			} else if (typeof response.data === 'object' && response.data.nom_ville) {
 				// Fallback if the API returns data directly
 				setLocationData(response.data)